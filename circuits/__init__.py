@@ -12,6 +12,7 @@ __version__ = "0.1"
 
 from .linear import Classifier
 from .circuits import Nnf, NnfManager
+from .compact import CompactNnf
 from .compiler import compile_nnf, compile_nnf_recursive, \
     compile_nnf_recursive_by_depth, \
     compile_nnf_automatic, compile_nnf_manual
@@ -19,11 +20,12 @@ from .nn import compile_nn
 from .obdd import ObddNode, ObddManager
 from .cnf import Cnf
 from .data import read_csv
+from .simulate import check_equivalence
 from .timer import Timer
 
-__all__ = ["Classifier","Nnf","NnfManager",\
+__all__ = ["Classifier","Nnf","NnfManager","CompactNnf",\
            "ObddNode","ObddManager","Cnf","Timer",\
            "compile_nnf","compile_nnf_recursive",
            "compile_nnf_recursive_by_depth",\
            "compile_nnf_automatic","compile_nnf_manual",\
-           "compile_nn","read_csv"]
+           "compile_nn","read_csv","check_equivalence"]
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+"""A reproducible benchmark suite.
+
+Inputs are generated from a seed, so that every run times the same
+circuits:
+
+    random_neuron   a neuron (Classifier) of a given size, with random
+                    weights, compiled at a given precision
+    random_network  a layered network of neurons, as an .nnf file of
+                    S-lines (with a .neuron file per neuron)
+    random_cnf_nnf  an NNF (an and of ors of literals) of a random k-CNF
+
+A suite (see SUITES) sweeps the sizes of each kind of input, and times
+Nnf.read, Nnf.flatten, Nnf.binarize, Nnf.model_count, Nnf.is_model,
+Classifier.compile and each compile_nnf_* strategy.  Each benchmark is
+run repeat times, and its time is the minimum over the runs.  Results
+are saved as JSON, and compared with a baseline (a saved result) to
+catch regressions:
+
+    python3 -m circuits.benchmark [quick|full] [RESULTS.json [BASELINE.json]]
+
+Times depend on the machine, so no baseline is shipped.  Record one on
+the machine used for comparisons (e.g., before a change), with the same
+suite:
+
+    python3 -m circuits.benchmark quick baseline-quick.json
+    ... # after the change:
+    python3 -m circuits.benchmark quick results.json baseline-quick.json
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import platform
+import tempfile
+
+from .circuits import Nnf, NnfManager, Literal, AndGate, OrGate
+from .linear import Classifier
+from .portfolio import STRATEGIES
+from .timer import Profiler
+
+# each suite gives, per kind of input, the sizes to sweep:
+#   neurons:  (size,precision)
+#   networks: (inputs,layers,width), where width is the number of
+#             neurons per hidden layer, each with all inputs of the
+#             previous layer
+#   cnfs:     (var_count,clause_count), of 3-CNFs
+SUITES = {
+    "quick": {
+        "repeat": 3,
+        "neurons": [ (16,2), (32,2), (32,3), (64,2) ],
+        "networks": [ (12,1,4), (16,2,6) ],
+        "cnfs": [ (20,60), (30,90) ],
+    },
+    "full": {
+        "repeat": 5,
+        "neurons": [ (16,2), (32,2), (32,3), (64,2), (64,3), (128,2) ],
+        "networks": [ (12,1,4), (16,2,6), (24,2,12), (32,3,16) ],
+        "cnfs": [ (20,60), (30,90), (40,120), (50,150) ],
+    },
+}
+
+############################################################
+# inputs
+############################################################
+
+def random_neuron(rng,size,name="neuron"):
+    """a neuron over size inputs, with weights uniform in [-1,1], and a
+    threshold uniform in [-size/8,size/8]"""
+    weights = [ "%.6f" % rng.uniform(-1,1) for _ in range(size) ]
+    threshold = "%.6f" % rng.uniform(-size/8,size/8)
+    return Classifier(name=name,size=str(size),weights=weights,
+                      threshold=threshold)
+
+def random_network(rng,dirname,inputs,layers,width):
+    """writes a network of neurons to dirname, and returns the filename
+    of its .nnf.  there are layers hidden layers of width neurons, and an
+    output neuron, where each neuron has all the nodes of the previous
+    layer as inputs"""
+    os.makedirs(dirname,exist_ok=True)
+    name = "net-%d-%d-%d" % (inputs,layers,width)
+    lines = [ "L %d" % var for var in range(1,inputs+1) ]
+    previous = list(range(inputs))
+    edge_count = 0
+    for layer in range(layers+1):
+        current = []
+        for i in range(1 if layer == layers else width):
+            neuron_name = "%s-%d-%d" % (name,layer,i)
+            filename = os.path.join(dirname,neuron_name + ".neuron")
+            random_neuron(rng,len(previous),neuron_name).save(filename)
+            children = " ".join(map(str,previous))
+            lines.append("S %d %s 0 %s" % (len(previous),children,
+                                           os.path.abspath(filename)))
+            edge_count += len(previous)
+            current.append(len(lines)-1)
+        previous = current
+    nnf_filename = os.path.join(dirname,name + ".nnf")
+    with open(nnf_filename,'w') as f:
+        f.write("nnf %d %d %d\n" % (len(lines),edge_count,inputs))
+        f.write("\n".join(lines) + "\n")
+    return nnf_filename
+
+def random_cnf_nnf(rng,var_count,clause_count,k=3):
+    """returns (manager,nnf), where nnf is an and of ors of literals, for
+    a random k-CNF (of clauses over k distinct variables)"""
+    mgr = NnfManager(var_count)
+    clauses = []
+    for _ in range(clause_count):
+        variables = rng.sample(range(1,var_count+1),k)
+        literals = [ var if rng.random() < 0.5 else -var for var in variables ]
+        literals = [ mgr.new_node(Literal,literal=lit) for lit in literals ]
+        clauses.append(mgr.new_node(OrGate,children=literals))
+    root = mgr.new_node(AndGate,children=clauses)
+    node_count,edge_count = root.count_and_size()
+    return mgr,Nnf(node_count,edge_count,var_count,root)
+
+def random_instance(rng,var_count):
+    """an instance for Nnf.is_model"""
+    return [None] + [ rng.randint(0,1) for _ in range(var_count) ]
+
+############################################################
+# benchmarks
+############################################################
+
+class Benchmark:
+    """times stages of a Profiler, keeping the minimum time of each"""
+
+    def __init__(self,repeat=3,verbose=True):
+        self.repeat = repeat
+        self.verbose = verbose
+        self.profiler = Profiler("benchmark")
+        self.results = {}
+
+    def time(self,name,function,setup=None):
+        """times function(setup()) repeat times (setup is not timed), and
+        returns the result of the last run"""
+        for _ in range(self.repeat):
+            args = () if setup is None else (setup(),)
+            with self.profiler.stage(name):
+                result = function(*args)
+        stage = self.profiler.root.children[name]
+        self.results[name] = stage.wall_min
+        if self.verbose:
+            print("%-50s %10.4fs" % (name,stage.wall_min),flush=True)
+        return result
+
+def _sdd_manager(var_count):
+    from pysdd.sdd import Vtree, SddManager
+    vtree = Vtree(var_count=var_count,vtree_type="balanced")
+    return SddManager.from_vtree(vtree)
+
+def bench_neurons(bench,rng,sizes):
+    for size,precision in sizes:
+        case = "neuron-%d-p%d" % (size,precision)
+        c = random_neuron(rng,size).with_precision(precision)
+        obdd_manager,root = bench.time("Classifier.compile/" + case,
+                                       lambda: c.compile())
+        nnf_manager,nnf = obdd_manager.obdd_to_nnf(root)
+        bench.time("Nnf.model_count/" + case,lambda: nnf.model_count())
+
+def bench_networks(bench,rng,sizes,dirname,precision=2):
+    from .cache import default_cache
+    for inputs,layers,width in sizes:
+        case = "network-%d-%d-%d" % (inputs,layers,width)
+        filename = random_network(rng,dirname,inputs,layers,width)
+        manager,nnf = bench.time("Nnf.read/" + case,
+                                 lambda: Nnf.read(filename))
+        def setup():
+            default_cache.clear() # compile the neurons every time
+            return Nnf.read(filename)
+        def flatten(args):
+            manager,nnf = args
+            return manager,nnf.flatten(manager,precision=precision)
+        manager,flat = bench.time("Nnf.flatten/" + case,flatten,setup=setup)
+        bench.time("Nnf.binarize/" + case,lambda: flat.binarize(manager))
+        instances = [ random_instance(rng,inputs) for _ in range(100) ]
+        bench.time("Nnf.is_model/" + case,
+                   lambda: [ flat.is_model(inst) for inst in instances ])
+        bench_strategies(bench,case,flat,inputs)
+
+def bench_cnfs(bench,rng,sizes):
+    for var_count,clause_count in sizes:
+        case = "cnf-%d-%d" % (var_count,clause_count)
+        manager,nnf = random_cnf_nnf(rng,var_count,clause_count)
+        instances = [ random_instance(rng,var_count) for _ in range(100) ]
+        bench.time("Nnf.is_model/" + case,
+                   lambda: [ nnf.is_model(inst) for inst in instances ])
+        bench_strategies(bench,case,nnf,var_count)
+
+def bench_strategies(bench,case,nnf,var_count):
+    for strategy,compile_function in STRATEGIES.items():
+        bench.time("%s/%s" % (compile_function.__name__,case),
+                   lambda mgr: compile_function(nnf,mgr),
+                   setup=lambda: _sdd_manager(var_count))
+
+def run_suite(suite="quick",seed=0,dirname=None,verbose=True):
+    """runs the named suite (see SUITES), generating inputs from seed.
+    network files are written to dirname (by default, a temporary
+    directory that is removed afterwards).  returns a dict of results"""
+    if suite not in SUITES:
+        raise Exception("run_suite: unknown suite %s" % suite)
+    config = SUITES[suite]
+    bench = Benchmark(repeat=config["repeat"],verbose=verbose)
+    tmp_dirname = None
+    if dirname is None: dirname = tmp_dirname = tempfile.mkdtemp()
+    try:
+        bench_neurons(bench,random.Random(seed),config["neurons"])
+        bench_networks(bench,random.Random(seed),config["networks"],dirname)
+        bench_cnfs(bench,random.Random(seed),config["cnfs"])
+    finally:
+        if tmp_dirname is not None: shutil.rmtree(tmp_dirname)
+    return { "suite": suite, "seed": seed,
+             "python": platform.python_version(),
+             "machine": platform.machine(),
+             "results": bench.results,
+             "profile": bench.profiler.to_dict() }
+
+def save_results(results,filename):
+    with open(filename,'w') as f:
+        json.dump(results,f,indent=2)
+
+def read_results(filename):
+    if not os.path.exists(filename):
+        msg = "no results file %s" % filename
+        raise Exception("read_results: %s" % msg)
+    with open(filename,'r') as f:
+        return json.load(f)
+
+def compare(results,baseline,tolerance=1.25,min_time=0.005):
+    """compares results with baseline (both as returned by run_suite).
+    a benchmark is a regression if it is more than tolerance times
+    slower than the baseline, and an improvement if it is more than
+    tolerance times faster (benchmarks taking less than min_time in
+    both are ignored, as too noisy).  returns a list of (name,baseline
+    time,time,ratio,status)"""
+    rows = []
+    new,old = results["results"],baseline["results"]
+    for name in sorted(set(new) | set(old)):
+        if name not in old:
+            rows.append((name,None,new[name],None,"new"))
+            continue
+        if name not in new:
+            rows.append((name,old[name],None,None,"missing"))
+            continue
+        ratio = new[name]/old[name] if old[name] > 0 else float('inf')
+        if max(new[name],old[name]) < min_time:
+            status = "ok"
+        elif ratio > tolerance:
+            status = "regression"
+        elif ratio < 1/tolerance:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append((name,old[name],new[name],ratio,status))
+    return rows
+
+def print_comparison(rows):
+    fmt = lambda t: "" if t is None else "%.4fs" % t
+    for name,old,new,ratio,status in rows:
+        ratio = "" if ratio is None else "%.2fx" % ratio
+        print("%-50s %10s %10s %7s %s" % (name,fmt(old),fmt(new),ratio,status))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 4:
+        opts = "[quick|full] [RESULTS.json [BASELINE.json]]"
+        print( "usage: %s %s" % (sys.argv[0],opts) )
+        exit(1)
+
+    suite = "quick" if len(sys.argv) <= 1 else sys.argv[1]
+    results_filename = None if len(sys.argv) <= 2 else sys.argv[2]
+    baseline_filename = None if len(sys.argv) <= 3 else sys.argv[3]
+    if baseline_filename is not None and \
+       not os.path.exists(baseline_filename):
+        print("no baseline %s; record one first with:" % baseline_filename)
+        print("    python3 -m circuits.benchmark %s %s" % \
+              (suite,baseline_filename))
+        exit(1)
+    results = run_suite(suite)
+    if results_filename is not None:
+        save_results(results,results_filename)
+    if baseline_filename is not None:
+        rows = compare(results,read_results(baseline_filename))
+        print_comparison(rows)
+        regressions = [ row for row in rows if row[-1] == "regression" ]
+        if regressions:
+            print("%d regression(s)" % len(regressions))
+            exit(2)
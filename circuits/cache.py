@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+from collections import OrderedDict
+
+class NeuronCache:
+    """Cache of compiled neurons (the NNF of a neuron's OBDD).
+
+    Entries are keyed by (hash of the neuron file's contents, precision,
+    variable ordering), so identical neurons are compiled once, whatever
+    their filename.
+    Entries are kept in an in-process LRU of max_size entries, and, if
+    dirname is given, in an on-disk cache of .nnf files that persists
+    across runs.  The quantized neurons themselves (for evaluating a
+    neuron by its weighted sum) are cached in-process.
+    """
+
+    def __init__(self,max_size=1024,dirname=None):
+        self.max_size = max_size
+        self.dirname = dirname
+        self.entries = OrderedDict()
+        self.classifiers = {}
+        self._hashes = {} # (filename,mtime,size) -> content hash
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        st = "NeuronCache(hits=%d,disk_hits=%d,misses=%d,size=%d)" % \
+             (self.hits,self.disk_hits,self.misses,len(self.entries))
+        return st
+
+    def stats(self):
+        return { "hits": self.hits, "disk_hits": self.disk_hits,
+                 "misses": self.misses, "size": len(self.entries) }
+
+    def clear(self):
+        """clears the in-process cache (the on-disk cache is kept)"""
+        self.entries.clear()
+        self.classifiers.clear()
+        self._hashes.clear()
+
+    def content_hash(self,filename):
+        st = os.stat(filename)
+        file_key = (os.path.abspath(filename),st.st_mtime_ns,st.st_size)
+        if file_key not in self._hashes:
+            with open(filename,'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self._hashes[file_key] = digest
+        return self._hashes[file_key]
+
+    def key(self,filename,precision,ordering=None):
+        """the key of a neuron's entry.  an explicit variable order (a
+        list) is keyed as a tuple"""
+        if ordering is not None and not isinstance(ordering,str):
+            ordering = tuple(ordering)
+        return (self.content_hash(filename),precision,ordering)
+
+    def _disk_filename(self,key):
+        digest,precision,ordering = key
+        if ordering is None:
+            basename = "%s-%s.nnf" % (digest,precision)
+        elif isinstance(ordering,str):
+            basename = "%s-%s-%s.nnf" % (digest,precision,ordering)
+        else: # an explicit order, by its hash
+            order = ",".join(map(str,ordering)).encode()
+            order = hashlib.sha256(order).hexdigest()[:16]
+            basename = "%s-%s-order-%s.nnf" % (digest,precision,order)
+        return os.path.join(self.dirname,basename)
+
+    def get(self,filename,precision,ordering=None):
+        """returns (nnf_manager,nnf) for the neuron in filename,
+        quantized to the given precision, and compiled with the named
+        variable ordering (see circuits.ordering)"""
+        key = self.key(filename,precision,ordering)
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            entry = compile_neuron(filename,precision,ordering)
+            self._store(key,entry)
+        return entry
+
+    def get_many(self,jobs,workers=None):
+        """returns the entries (see get) for jobs, a list of (filename,
+        precision,ordering).  neurons not yet cached are compiled in a
+        pool of worker processes (at most one per distinct key), which
+        return them as CompactNnf's.  workers is the pool size (by
+        default, the number of CPUs)"""
+        from concurrent.futures import ProcessPoolExecutor
+        from .circuits import NnfManager
+
+        keys = [ self.key(*job) for job in jobs ]
+        found,pending = {},{}
+        for key,job in zip(keys,jobs):
+            if key in found or key in pending: # served by another job
+                self.hits += 1
+                continue
+            entry = self._lookup(key)
+            if entry is None:
+                pending[key] = job
+            else:
+                found[key] = entry
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [ (key,pool.submit(_compile_compact,*job))
+                            for key,job in pending.items() ]
+                for key,future in futures:
+                    compact = future.result()
+                    manager = NnfManager(compact.var_count)
+                    entry = (manager,manager.from_compact(compact))
+                    self.misses += 1
+                    self._store(key,entry)
+                    found[key] = entry
+        return [ found[key] for key in keys ]
+
+    def _lookup(self,key):
+        """returns the entry for key, from memory or from disk, or None"""
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.dirname is None: return None
+        disk_filename = self._disk_filename(key)
+        if not os.path.exists(disk_filename): return None
+        from .circuits import Nnf
+        self.disk_hits += 1
+        entry = Nnf.read(disk_filename)
+        self._insert(key,entry)
+        return entry
+
+    def _store(self,key,entry):
+        """adds a newly compiled entry, in memory and on disk"""
+        if self.dirname is not None:
+            disk_filename = self._disk_filename(key)
+            os.makedirs(self.dirname,exist_ok=True)
+            tmp_filename = "%s.%d.tmp" % (disk_filename,os.getpid())
+            entry[1].save(tmp_filename)
+            os.replace(tmp_filename,disk_filename)
+        self._insert(key,entry)
+
+    def _insert(self,key,entry):
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get_classifier(self,filename,precision):
+        """returns the neuron in filename, quantized to the given
+        precision (as used by get)"""
+        key = (self.content_hash(filename),precision)
+        if key not in self.classifiers:
+            self.classifiers[key] = read_neuron(filename,precision)
+        return self.classifiers[key]
+
+def read_neuron(filename,precision):
+    """reads a neuron file, returns it quantized to the given precision"""
+    from .linear import Classifier
+    extension = os.path.splitext(filename)[-1]
+    if extension == ".neuron" or extension == "":
+        c = Classifier.read(filename)
+        return c.with_precision(precision)
+    else:
+        msg = "unknown extension %s" % extension
+        raise Exception("read_neuron: %s" % msg)
+
+def compile_neuron(filename,precision,ordering=None):
+    """compiles a neuron file to an NNF, returns (nnf_manager,nnf)"""
+    d = read_neuron(filename,precision)
+    manager,obdd = d.compile(order=ordering)
+    return manager.obdd_to_nnf(obdd)
+
+def _compile_compact(filename,precision,ordering):
+    """compiles a neuron file, in a worker process (see get_many)"""
+    manager,nnf = compile_neuron(filename,precision,ordering)
+    return manager.to_compact(nnf)
+
+# the cache used by NnfGate and CompactNnf.  set the environment
+# variable NNF_NEURON_CACHE (or default_cache.dirname) to a directory to
+# enable the on-disk cache
+default_cache = NeuronCache(dirname=os.environ.get("NNF_NEURON_CACHE"))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""Checkpointing and resuming long SDD compilations.
+
+compile_nnf_manual and compile_nnf_automatic compile an NNF in post-order
+(see Nnf.nodes), so at any point, the state of a compilation is the
+position of the next node in the post-order, and the SDDs of the
+frontier: the compiled nodes that still have a parent to be compiled.
+A Checkpointer periodically saves this state in a directory:
+
+    vtree           the manager's vtree (which minimization may change)
+    N.sdd           the SDD of the node at position N of the frontier
+    checkpoint.json the position, and the frontier positions with their
+                    number of remaining references
+
+Literals of the frontier are not saved, but are rebuilt on resume.  A
+checkpoint is written to a temporary directory, which then replaces the
+previous checkpoint, so a crash while saving leaves the last one intact.
+
+    >>> checkpoint = Checkpointer("run.ckpt",interval=1800)
+    >>> alpha = compile_nnf_manual(nnf,mgr,checkpoint=checkpoint)
+    ... # after a crash:
+    >>> mgr,alpha = resume(nnf,"run.ckpt",checkpoint=checkpoint)
+"""
+
+import os
+import json
+import time
+import shutil
+
+from .circuits import Literal
+from .compiler import _compile_post_order, _combiner, \
+    default_manual_scheduler
+from .scheduler import AutoScheduler
+from .telemetry import get_telemetry
+
+# the default scheduler of each strategy that supports checkpoints
+SCHEDULERS = {
+    "manual": default_manual_scheduler,
+    "automatic": AutoScheduler,
+}
+
+class Checkpointer:
+    """saves a checkpoint every interval seconds, or every every nodes
+    (whichever comes first), into the directory dirname"""
+
+    def __init__(self,dirname,interval=3600.0,every=None):
+        self.dirname = dirname
+        self.interval = interval
+        self.every = every
+        self.saves = 0
+        self.save_time = 0.0
+
+    def start(self,nnf,mgr,strategy):
+        self.strategy = strategy
+        self.last_time = time.time()
+        self.last_position = None
+
+    def step(self,nnf,mgr,position):
+        if self.last_position is None: self.last_position = position-1
+        due = self.interval is not None and \
+              time.time()-self.last_time >= self.interval
+        due = due or (self.every is not None and \
+                      position-self.last_position >= self.every)
+        if due: self.save(nnf,mgr,position)
+
+    def save(self,nnf,mgr,position):
+        """saves the state before compiling the node at position"""
+        start = time.time()
+        nodes = nnf.nodes()
+        index = { node: i for i,node in enumerate(nodes) }
+        frontier = {} # position -> remaining references
+        for node in nodes[position:]:
+            if isinstance(node,Literal): continue
+            for child in node.children:
+                i = index[child]
+                if i < position: frontier[i] = frontier.get(i,0) + 1
+        if position == len(nodes): # the root is done
+            frontier[position-1] = 1
+
+        tmp_dirname = self.dirname + ".tmp"
+        if os.path.exists(tmp_dirname): shutil.rmtree(tmp_dirname)
+        os.makedirs(tmp_dirname)
+        mgr.vtree().save(os.path.join(tmp_dirname,"vtree").encode())
+        for i in frontier:
+            if isinstance(nodes[i],Literal): continue
+            filename = os.path.join(tmp_dirname,"%d.sdd" % i)
+            nodes[i]._data.save(filename.encode())
+        meta = { "strategy": self.strategy,
+                 "position": position,
+                 "node_count": len(nodes),
+                 "frontier": { str(i): refs for i,refs in frontier.items() },
+                 "saved_at": time.time() }
+        with open(os.path.join(tmp_dirname,"checkpoint.json"),'w') as f:
+            json.dump(meta,f)
+
+        old_dirname = self.dirname + ".old"
+        if os.path.exists(old_dirname): shutil.rmtree(old_dirname)
+        if os.path.exists(self.dirname): os.rename(self.dirname,old_dirname)
+        os.rename(tmp_dirname,self.dirname)
+        if os.path.exists(old_dirname): shutil.rmtree(old_dirname)
+
+        self.last_time = time.time()
+        self.last_position = position
+        self.saves += 1
+        self.save_time += self.last_time-start
+
+def read_checkpoint(dirname):
+    with open(os.path.join(dirname,"checkpoint.json"),'r') as f:
+        return json.load(f)
+
+def resume(nnf,dirname,verbose=False,scheduler=None,checkpoint=None,
+           telemetry=None,combine="linear"):
+    """resumes the compilation of nnf from the checkpoint in dirname, with
+    a new SddManager.  scheduler defaults to that of the checkpointed
+    strategy.  returns (sdd_manager,sdd_node)"""
+    from pysdd.sdd import Vtree, SddManager
+
+    meta = read_checkpoint(dirname)
+    nodes = nnf.nodes()
+    if len(nodes) != meta["node_count"]:
+        msg = "checkpoint has %d nodes, nnf has %d" % \
+              (meta["node_count"],len(nodes))
+        raise Exception("resume: %s" % msg)
+    vtree = Vtree.from_file(os.path.join(dirname,"vtree").encode())
+    mgr = SddManager.from_vtree(vtree)
+    strategy = meta["strategy"]
+    if scheduler is None: scheduler = SCHEDULERS[strategy]()
+
+    nnf._prime_ref_count()
+    for i,refs in meta["frontier"].items():
+        node = nodes[int(i)]
+        if isinstance(node,Literal):
+            alpha = mgr.literal(node.literal)
+        else:
+            filename = os.path.join(dirname,"%s.sdd" % i)
+            alpha = mgr.read_sdd_file(filename.encode())
+        for _ in range(refs): alpha.ref()
+        node._data = alpha
+
+    scheduler.start(mgr)
+    if checkpoint is not None: checkpoint.start(nnf,mgr,strategy)
+    t = get_telemetry(telemetry,verbose)
+    t.start(nnf,mgr,strategy,scheduler,verbose)
+    alpha = _compile_post_order(nnf,mgr,scheduler,checkpoint,t,
+                                _combiner(combine),start=meta["position"])
+    nnf._clear_data()
+
+    scheduler.finish(mgr)
+    alpha.deref()
+    t.finish(mgr,alpha)
+    return (mgr,alpha)
@@ -1,16 +1,34 @@
 #!/usr/bin/env python3
 
-import os
-from .linear import Classifier
+import gc
+import warnings
+from collections import defaultdict
+from itertools import count
+from operator import attrgetter
+from .simulate import popcount
+from .data import read_chunks
+
+_node_id = attrgetter("node_id")
+
+# traversal stamps: a node whose _mark is not the current traversal's
+# epoch counts as unvisited, so no pass is needed to clear marks
+_epochs = count(1)
 
 class Gate:
+    # fixed attribute layouts: no per-node __dict__.  scratch space for
+    # traversals and compilers has its own slots (_data, _depth, _index)
+    __slots__ = ("node_id","node_vars","_mark","_data","_ref_count",
+                 "_negated","_depth","_index")
+
     def __init__(self,node_id):
         self.node_id = node_id
-        self.node_vars = None
-        self._bit = False # internal bit field
+        self.node_vars = None # bitset of variables (see Nnf.model_count)
+        self._mark = 0 # epoch of last traversal that visited this node
         self._data = None
         self._ref_count = None
         self._negated = None
+        self._depth = None # see compiler.label_nodes_by_depth
+        self._index = None # see NnfManager._reindex
 
     def is_input(self):
         """Returns true if node is a literal, and false otherwise"""
@@ -52,14 +70,14 @@ class Gate:
     def negate(self,manager):
         pass
 
-    def is_model(self,inst,clear_bits=True):
+    def is_model(self,inst):
         # inst is a map: var_index -> {0,1}
-        if self._bit is True: return self._data
-        self._bit = True
-        sat = self._is_model(inst)
-        self._data = sat
-        if clear_bits:
-            self.clear_bits(clear_data=True)
+        order = self.post_order()
+        for node in order:
+            node._data = node._is_model(inst)
+        sat = self._data
+        for node in order:
+            node._data = None
         return sat
 
 
@@ -67,27 +85,40 @@ class Gate:
     # TRAVERSAL
     ########################################
 
-    def __iter__(self,marker=True,clear_data=False,clear_bits=True):
-        """post-order (children before parents) generator"""
-        if self._bit is marker: return
-        self._bit = marker
-
-        if self.is_gate():
-            for child in self.children:
-                for node in child.__iter__(marker=marker,clear_bits=False):
-                    yield node
-        yield self
-
-        if clear_bits:
-            self.clear_bits(clear_data=clear_data)
+    def post_order(self):
+        """returns a list of the nodes below this one, in post-order
+        (children before parents).  iterative, so deep circuits do not
+        hit the recursion limit"""
+        epoch = next(_epochs)
+        order = []
+        self._mark = epoch
+        stack = [(self,iter(self.children))]
+        while stack:
+            node,children = stack[-1]
+            for child in children:
+                if child._mark != epoch:
+                    child._mark = epoch
+                    stack.append((child,iter(child.children)))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        return order
 
-    def clear_bits(self,clear_data=False):
-        """clears bits set by recursive traversal"""
-        for node in self.__iter__(marker=False,clear_bits=False):
-            if clear_data: node._data = None
+    def __iter__(self,clear_data=False):
+        """post-order (children before parents) generator"""
+        order = self.post_order()
+        for node in order:
+            yield node
+        if clear_data:
+            for node in order:
+                node._data = None
 
 
 class Literal(Gate):
+    __slots__ = ("literal","var","val")
+    children = () # literals are leaves
+
     def __init__(self,node_id,literal):
         Gate.__init__(self,node_id)
         self.literal = literal
@@ -109,8 +140,15 @@ class Literal(Gate):
         sat = inst[self.var] == self.val
         return 1 if sat else 0
 
+    def _simulate(self,words,mask):
+        # words is a map: var_index -> bit-vector (int)
+        word = words[self.var]
+        return word if self.val else ~word & mask
+
 
 class AndGate(Gate):
+    __slots__ = ("children",)
+
     def __init__(self,node_id,children):
         Gate.__init__(self,node_id)
         self.children = children
@@ -129,15 +167,25 @@ class AndGate(Gate):
 
     def _is_model(self,inst):
         # inst is a map: var_index -> {0,1}
+        # assumes children have their values in _data (see Gate.is_model)
         sat = 1
         for child in self.children:
-            if not child.is_model(inst,clear_bits=False):
+            if not child._data:
                 sat = 0
                 break
         return sat
 
+    def _simulate(self,words,mask):
+        # assumes children have their words in _data (see Nnf.simulate)
+        word = mask
+        for child in self.children:
+            word &= child._data
+        return word
+
 
 class OrGate(Gate):
+    __slots__ = ("children","decision_var")
+
     def __init__(self,node_id,children,decision_var=0):
         Gate.__init__(self,node_id)
         self.children = children
@@ -158,22 +206,37 @@ class OrGate(Gate):
 
     def _is_model(self,inst):
         # inst is a map: var_index -> {0,1}
+        # assumes children have their values in _data (see Gate.is_model)
         sat = 0
         for child in self.children:
-            if child.is_model(inst,clear_bits=False):
+            if child._data:
                 sat = 1
                 break
         return sat
 
+    def _simulate(self,words,mask):
+        # assumes children have their words in _data (see Nnf.simulate)
+        word = 0
+        for child in self.children:
+            word |= child._data
+        return word
+
 
 class NnfGate(Gate):
-    def __init__(self,node_id,children,nnf=None,filename="missing-filename"):
+    __slots__ = ("children","nnf","nnf_manager","classifier","filename",
+                 "offset","precision","ordering")
+
+    def __init__(self,node_id,children,nnf=None,filename="missing-filename",
+                 offset=0):
         Gate.__init__(self,node_id)
         self.children = children
         self.nnf = nnf
         self.nnf_manager = None # AC
+        self.classifier = None
         self.filename = filename
+        self.offset = offset # as given in the S-line (unused)
         self.precision = 2 # AC
+        self.ordering = None # variable ordering (see circuits.ordering)
 
     def __repr__(self):
         child_ids = [ str(child) for child in self.children ]
@@ -181,18 +244,24 @@ class NnfGate(Gate):
                              self.filename)
         return st
 
-    def _make_nnf(self,precision=None):
+    def _make_nnf(self,precision=None,ordering=None):
+        """compiles the neuron, through the neuron cache (gates with
+        identical neurons share the compiled nnf, which is read-only)"""
+        from .cache import default_cache
         if self.nnf is not None: return
         if precision is None: precision = self.precision
-        extension = os.path.splitext(self.filename)[-1]
-        if extension == ".neuron" or extension == "":
-            c = Classifier.read(self.filename)
-            d = c.with_precision(precision)
-            manager,obdd = d.compile()
-            self.nnf_manager,self.nnf = manager.obdd_to_nnf(obdd)
-        else:
-            msg = "unknown extension %s" % extension
-            raise Exception("NnfGate._make_nnf: %s" % msg)
+        if ordering is None: ordering = self.ordering
+        self.nnf_manager,self.nnf = default_cache.get(self.filename,precision,
+                                                      ordering)
+        self.precision = precision
+        self.ordering = ordering
+
+    def _make_classifier(self):
+        """the quantized neuron, at the precision of the compiled nnf"""
+        from .cache import default_cache
+        if self.classifier is not None: return
+        self.classifier = default_cache.get_classifier(self.filename,
+                                                       self.precision)
 
     def negate(self,mgr):
         raise Exception("NnfGate.negate: unsupported")
@@ -203,9 +272,25 @@ class NnfGate(Gate):
         var_count = self.nnf_manager.var_count
         nnf_inst = [None] * (var_count+1)
         for var,child in enumerate(self.children,1):
-            nnf_inst[var] = child.is_model(inst,clear_bits=False)
+            nnf_inst[var] = child._data
         return self.nnf.is_model(nnf_inst)
 
+    def _evaluate(self):
+        """evaluates the neuron by its weighted sum, without compiling
+        it.  assumes children have their values in _data"""
+        self._make_classifier()
+        weights,threshold = self.classifier._int_weights()
+        total = 0
+        for weight,child in zip(weights,self.children):
+            if child._data: total += weight
+        return 1 if total >= threshold else 0
+
+    def _simulate(self,words,mask):
+        # assumes children have their words in _data (see Nnf.simulate)
+        self._make_nnf()
+        nnf_words = [0] + [ child._data for child in self.children ]
+        return self.nnf._simulate(nnf_words,mask)
+
 
 class Nnf:
     """NNF circuits"""
@@ -220,46 +305,87 @@ class Nnf:
         st = 'nnf %d %d %d' % (self.node_count,self.edge_count,self.var_count)
         return st
 
+    @property
+    def root(self):
+        return self._root
+
+    @root.setter
+    def root(self,root):
+        self._root = root
+        self._nodes = None # topological order is no longer valid
+        self._batch_plan = None
+
+    def nodes(self):
+        """returns the nodes of the circuit in a topological order
+        (children before parents).  the order is computed once and
+        cached until the root changes"""
+        if self._nodes is None:
+            self._nodes = self.root.post_order()
+        return self._nodes
+
+    def _clear_data(self):
+        for node in self.nodes():
+            node._data = None
+
     ########################################
     # QUERIES & TRANSFORMATIONS
     ########################################
 
     def model_count(self):
-        self._used_variables()
-        for node in self.root.__iter__(clear_data=True):
+        """model count, assuming the circuit is a d-DNNF.
+
+        the variables below each node are kept as a bitset (an int),
+        along with its popcount.  a node's bitset is released once all
+        of its parents are counted, so only the frontier is kept"""
+        self._prime_ref_count()
+        for node in self.nodes():
             if isinstance(node,Literal):
-                count = 1
+                count,node_vars = 1,1 << node.var
             elif isinstance(node,AndGate):
-                count = 1
+                count,node_vars = 1,0
                 for child in node.children:
-                    count *= child._data
+                    count *= child._data[0]
+                    node_vars |= child.node_vars
             elif isinstance(node,OrGate):
-                count = 0
-                node_var_count = len(node.node_vars)
+                count,node_vars = 0,0
                 for child in node.children:
-                    gap_size = node_var_count - len(child.node_vars)
-                    count += child._data << gap_size
+                    node_vars |= child.node_vars
+                node_var_count = popcount(node_vars)
+                for child in node.children:
+                    child_count,child_var_count = child._data
+                    gap_size = node_var_count - child_var_count
+                    count += child_count << gap_size
             else:
                 raise Exception("model_count: unknown type")
-            node._data = count
-        gap_size = self.var_count - len(self.root.node_vars)
+            node.node_vars = node_vars
+            node._data = (count,popcount(node_vars))
+            for child in node.children:
+                child._ref_count -= 1
+                if child._ref_count == 0:
+                    child.node_vars,child._data = None,None
+        count,node_var_count = self.root._data
+        self.root.node_vars,self.root._data = None,None
+        gap_size = self.var_count - node_var_count
         return count << gap_size
 
-    def _used_variables(self):
-        if self.root.node_vars is not None: return
-        for node in self.root:
-            node.node_vars = set()
-            if isinstance(node,Literal):
-                var = abs(node.literal)
-                node.node_vars.add(var)
-            elif isinstance(node,(AndGate,OrGate)):
-                for child in node.children:
-                    node.node_vars.update(child.node_vars)
-            else:
-                raise Exception("used_variables: unknown type")
+    def _make_nnfs(self,precision,ordering,workers):
+        """compiles the neurons of all NnfGate's, in parallel"""
+        from .cache import default_cache
+        gates,jobs = [],[]
+        for node in self.nodes():
+            if not isinstance(node,NnfGate) or node.nnf is not None:
+                continue
+            node_precision = node.precision if precision is None else precision
+            node_ordering = node.ordering if ordering is None else ordering
+            gates.append(node)
+            jobs.append((node.filename,node_precision,node_ordering))
+        entries = default_cache.get_many(jobs,workers=workers)
+        for node,job,entry in zip(gates,jobs,entries):
+            node.nnf_manager,node.nnf = entry
+            _,node.precision,node.ordering = job
 
     def _prime_ref_count(self):
-        for node in self.root.__iter__(clear_data=True):
+        for node in self.nodes():
             node._ref_count = 0
             if isinstance(node,Literal):
                 pass
@@ -270,12 +396,18 @@ class Nnf:
                 raise Exception("ref_count: unknown type")
         self.root._ref_count += 1
 
-    def flatten(self,mgr,precision=None):
-        """flatten NnfGate's to AndGate/OrGate's"""
+    def flatten(self,mgr,precision=None,ordering=None,workers=None):
+        """flatten NnfGate's to AndGate/OrGate's.  neurons are compiled
+        with the given variable ordering (see circuits.ordering).  if
+        workers is given, the distinct neurons are first compiled in
+        parallel, by a pool of that many processes (see
+        NeuronCache.get_many); the result is the same"""
 
-        for node in self.root.__iter__(clear_data=True):
+        if workers is not None:
+            self._make_nnfs(precision,ordering,workers)
+        for node in self.nodes():
             if isinstance(node,NnfGate):
-                node._make_nnf(precision)
+                node._make_nnf(precision,ordering)
                 inputs = [None] + node.children
                 for alpha in node.nnf.root.__iter__(clear_data=True):
                     if isinstance(alpha,Literal):
@@ -288,9 +420,15 @@ class Nnf:
                         beta = mgr.new_node(cls,children=new_children)
                     alpha._data = beta
                 alpha = beta
+            elif node.is_gate():
+                # gates above an NnfGate need their (flattened) children
+                cls = type(node)
+                new_children = [ c._data for c in node.children ]
+                alpha = mgr.new_node(cls,children=new_children)
             else:
                 alpha = node
             node._data = alpha
+        self._clear_data()
         node_count,edge_count = alpha.count_and_size()
         nnf = Nnf(node_count,edge_count,mgr.var_count,alpha)
         return nnf
@@ -305,7 +443,7 @@ class Nnf:
 
         cls = type(node)
         if len(node.children) == 0:
-            return node._data
+            return mgr.new_node(cls,children=[])
         elif len(node.children) == 1:
             new_child = node.children[0]._data
             sibling = mgr.new_node(cls,children=[])
@@ -324,21 +462,144 @@ class Nnf:
     def binarize(self,mgr):
         """convert all AndGate/OrGate's to have 0 or 2 inputs."""
 
-        for node in self.root.__iter__(clear_data=True):
+        for node in self.nodes():
             if node.is_input():
                 node._data = node
             else: # node.is_gate()
                 new_node = self._binarize_node(mgr,node)
                 node._data = new_node
+        self._clear_data()
 
         alpha = new_node
         node_count,edge_count = alpha.count_and_size()
         nnf = Nnf(node_count,edge_count,mgr.var_count,alpha)
         return nnf
         
-    def is_model(self,inst):
-        # inst is a map: var_index -> {0,1}
-        return self.root.is_model(inst)
+    def is_model(self,inst,arithmetic=False):
+        """inst is a map: var_index -> {0,1}.  if arithmetic is true,
+        NnfGate's are evaluated by the weighted sum of their (quantized)
+        neuron, rather than by compiling the neuron to an NNF"""
+        for node in self.nodes():
+            if arithmetic and isinstance(node,NnfGate):
+                node._data = node._evaluate()
+            else:
+                node._data = node._is_model(inst)
+        sat = self.root._data
+        self._clear_data()
+        return sat
+
+    def simulate(self,words,width):
+        """bit-parallel simulation: words maps each variable to an int
+        whose j-th bit is the variable's value in input vector j (see
+        circuits.simulate).  returns the int of the circuit's outputs
+        on the width input vectors"""
+        return self._simulate(words,(1 << width)-1)
+
+    def _simulate(self,words,mask):
+        for node in self.nodes():
+            node._data = node._simulate(words,mask)
+        word = self.root._data
+        self._clear_data()
+        return word
+
+    def _make_batch_plan(self):
+        """groups the gates by level (longest path from a literal), and
+        for each level, stores the gates and their children as index
+        arrays, for use by is_model_batch"""
+        import numpy as np
+
+        nodes = self.nodes()
+        for index,node in enumerate(nodes):
+            node._data = index
+        levels = [0]*len(nodes)
+        literals,lit_vars,lit_vals = [],[],[]
+        gates = defaultdict(lambda: ([],[]))
+        for index,node in enumerate(nodes):
+            if isinstance(node,Literal):
+                literals.append(index)
+                lit_vars.append(node.var-1)
+                lit_vals.append(node.val)
+                continue
+            children = [ child._data for child in node.children ]
+            level = 1 + max([ levels[c] for c in children ],default=0)
+            levels[index] = level
+            if isinstance(node,NnfGate):
+                cls = NnfGate
+            elif isinstance(node,(AndGate,OrGate)):
+                cls = type(node) if children else (type(node),None)
+            else:
+                raise Exception("Nnf.is_model_batch: unknown type")
+            ids,child_ids = gates[(level,cls)]
+            ids.append(index)
+            child_ids.append(children)
+        self._clear_data()
+
+        plan = []
+        for level,cls in sorted(gates,key=lambda key: key[0]):
+            ids,child_ids = gates[(level,cls)]
+            if cls is NnfGate:
+                step = [ (index,np.array(children),nodes[index]) \
+                         for index,children in zip(ids,child_ids) ]
+            else:
+                sizes = [ len(children) for children in child_ids ]
+                starts = np.cumsum([0] + sizes[:-1])
+                flat = [ c for children in child_ids for c in children ]
+                step = (np.array(ids),np.array(flat,dtype=np.int64),starts)
+            plan.append((cls,step))
+        literals = (np.array(literals,dtype=np.int64),
+                    np.array(lit_vars,dtype=np.int64),
+                    np.array(lit_vals,dtype=bool))
+        self._batch_plan = (literals,plan)
+        return self._batch_plan
+
+    def is_model_batch(self,X,chunk_size=None,arithmetic=False):
+        """evaluates the circuit on each row of X, an (N x var_count)
+        0/1 matrix where column i is the value of variable i+1.
+        returns an N-vector of 0/1 outputs.  the circuit is evaluated
+        level by level, using one array operation per level and gate
+        type, on chunk_size rows at a time.  for arithmetic, see
+        is_model"""
+        import numpy as np
+
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] < self.var_count:
+            msg = "expected an (N x %d) matrix" % self.var_count
+            raise Exception("Nnf.is_model_batch: %s" % msg)
+        X = X.astype(bool)
+        if self._batch_plan is None: self._make_batch_plan()
+        (lit_ids,lit_vars,lit_vals),plan = self._batch_plan
+        root_index = len(self.nodes())-1
+        N = X.shape[0]
+        if chunk_size is None: # aim for at most 64MB of node values
+            chunk_size = max(1,min(N,2**26 // (root_index+1)))
+
+        output = np.empty(N,dtype=np.uint8)
+        values = np.empty((root_index+1,chunk_size),dtype=bool)
+        for first in range(0,N,chunk_size):
+            rows = X[first:first+chunk_size]
+            n = rows.shape[0]
+            vals = values[:,:n]
+            vals[lit_ids] = rows[:,lit_vars].T == lit_vals[:,None]
+            for cls,step in plan:
+                if cls is NnfGate:
+                    for index,children,node in step:
+                        inputs = vals[children].T
+                        if arithmetic:
+                            node._make_classifier()
+                            outputs = node.classifier.evaluate_batch(inputs)
+                        else:
+                            node._make_nnf()
+                            outputs = node.nnf.is_model_batch(inputs)
+                        vals[index] = outputs
+                elif isinstance(cls,tuple): # constants
+                    ids = step[0]
+                    vals[ids] = cls[0] is AndGate
+                else:
+                    ids,children,starts = step
+                    op = np.logical_and if cls is AndGate else np.logical_or
+                    vals[ids] = op.reduceat(vals[children],starts,axis=0)
+            output[first:first+n] = vals[root_index]
+        return output
 
     ########################################
     # I/O
@@ -350,7 +611,7 @@ class Nnf:
         constants = []
         literals = []
         nodes = []
-        for node in self.root:
+        for node in self.nodes():
             if node.is_input():
                 literals.append(node)
             else: # node.is_gate()
@@ -366,71 +627,173 @@ class Nnf:
 
     @staticmethod
     def read(filename):
-        with open(filename,'r') as f:
-            lines = f.readlines()
-        my_node_count = len(lines) - 1 
-        nodes = [None]*my_node_count
-        for node_id,line in enumerate(lines):
-            line = line.strip().split()
-            node_id = node_id-1
-            if line[0] == 'nnf':
-                node_count = int(line[1])
-                edge_count = int(line[2])
-                var_count = int(line[3])
-                manager = NnfManager(var_count)
-                assert node_count == len(nodes)
-                continue
-            elif line[0] == 'L':
-                literal = int(line[1])
-                node = manager.new_node(Literal,literal=literal)
-            elif line[0] == 'A':
-                child_count = int(line[1])
-                children = [ int(x) for x in line[2:] ]
-                assert len(children) == child_count
-                children = [ nodes[child_id] for child_id in children ]
-                node = manager.new_node(AndGate,children=children)
-            elif line[0] == 'O':
-                decision_var = int(line[1]) # ignore
-                child_count = int(line[2])
-                children = [ int(x) for x in line[3:] ]
-                assert len(children) == child_count
-                children = [ nodes[child_id] for child_id in children ]
-                node = manager.new_node(OrGate,children=children)
-            elif line[0] == 'S':
-                child_count = int(line[1])
-                children = [ int(x) for x in line[2:-2] ] # skip offset ## ACAC
-                offset = int(line[-2])
-                assert len(children) == child_count
-                children = [ nodes[child_id] for child_id in children ]
-                filename = line[-1]
-                node = manager.new_node(NnfGate,children=children,
-                                        filename=filename)
-            else:
-                raise Exception("Nnf.save: unknown type")
-            nodes[node_id] = node
-        alpha = Nnf(node_count,edge_count,var_count,node)
+        """read an .nnf file.  the file is read in large chunks of whole
+        lines (see read_chunks), each chunk is parsed at once (see
+        _chunk_values), and nodes are built as they are parsed.  the
+        header's node, edge and variable counts are checked"""
+        chunks = read_chunks(filename)
+        header,_,chunk = next(chunks,"").partition("\n")
+        header = header.split()
+        if len(header) != 4 or header[0] != 'nnf':
+            raise Exception("Nnf.read: expected header: nnf N E V")
+        node_count,edge_count,var_count = map(int,header[1:])
+        manager = NnfManager(var_count)
+        # the nodes form no cycles, so the cyclic garbage collector only
+        # slows down building many of them
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            nodes,my_edge_count = Nnf._read_nodes(manager,chunk,chunks)
+        finally:
+            if gc_enabled: gc.enable()
+        if len(nodes) != node_count or my_edge_count != edge_count:
+            msg = "found %d nodes and %d edges, expected %d and %d" % \
+                  (len(nodes),my_edge_count,node_count,edge_count)
+            raise Exception("Nnf.read: %s" % msg)
+        alpha = Nnf(node_count,edge_count,var_count,nodes[-1])
         return manager,alpha
 
-    def save(self,filename):
-        idmap = {}
-        with open(filename,'w') as f:
-            f.write("nnf %d %d %d\n" % 
-                    (self.node_count,self.edge_count,self.var_count))
-            for node_id,node in enumerate(self.root):
-                idmap[node.node_id] = node_id # id in file
+    @staticmethod
+    def _read_nodes(manager,chunk,chunks):
+        """parses the lines of chunk, and then of each chunk of chunks,
+        returning the nodes (in file order) and the number of edges"""
+        var_count = manager.var_count
+        cache,literals = manager.cache,manager.literals
+        nodes = []
+        my_edge_count = 0
+        while True:
+            values,tokens = _chunk_values(chunk)
+            # a line with the wrong number of children misaligns the
+            # values, which then fail the checks of types and children
+            i,end = 0,len(values)
+            try:
+                while i < end:
+                    node_id = len(nodes)
+                    kind = values[i]
+                    if kind == _L:
+                        literal = values[i+1]
+                        i += 2
+                        if not 0 < abs(literal) <= var_count:
+                            msg = "literal %d out of range" % literal
+                            raise Exception("Nnf.read: %s" % msg)
+                        nodes.append(literals[literal])
+                        continue
+                    if kind == _A:
+                        cls = AndGate
+                    elif kind == _O: # decision_var is ignored
+                        cls = OrGate
+                        i += 1
+                    elif kind == _S:
+                        cls = NnfGate
+                    else:
+                        token = kind if tokens is None else tokens[i]
+                        msg = "unknown type %s" % token
+                        raise Exception("Nnf.read: %s" % msg)
+                    child_count = values[i+1]
+                    first = i+2
+                    i = first + child_count
+                    child_ids = values[first:i]
+                    if len(child_ids) != child_count or (child_ids and \
+                       not 0 <= min(child_ids) <= max(child_ids) < node_id):
+                        msg = "bad children on line %d" % (node_id+2)
+                        raise Exception("Nnf.read: %s" % msg)
+                    my_edge_count += child_count
+                    if cls is NnfGate: # S k ids offset filename
+                        offset,filename = values[i],tokens[i+1]
+                        i += 2
+                        children = [ nodes[c] for c in child_ids ]
+                        node = manager.new_node(NnfGate,children=children,
+                                                filename=filename,
+                                                offset=offset)
+                    else: # as in NnfManager.new_node
+                        children = map(nodes.__getitem__,child_ids)
+                        children = tuple(sorted(children,key=_node_id))
+                        key = (cls,children)
+                        node = cache.get(key)
+                        if node is None:
+                            node = cls(manager.new_id(),children)
+                            cache[key] = node
+                    nodes.append(node)
+            except (TypeError,IndexError):
+                msg = "bad line %d" % (len(nodes)+2)
+                raise Exception("Nnf.read: %s" % msg)
+            chunk = next(chunks,None)
+            if chunk is None: break
+        return nodes,my_edge_count
+
+    def save(self,filename,buffer_size=2**16):
+        """save as an .nnf file, writing buffer_size lines at a time.
+        the header counts the lines written (the nodes reachable from the
+        root), which may differ from node_count and edge_count"""
+        nodes = self.nodes()
+        edge_count = sum( len(node.children) for node in nodes
+                          if not isinstance(node,Literal) )
+        idmap = {} # node_id -> id in file (as a string)
+        with open(filename,'w',buffering=2**20) as f:
+            f.write("nnf %d %d %d\n" % (len(nodes),edge_count,self.var_count))
+            buf = []
+            for node_id,node in enumerate(nodes):
+                idmap[node.node_id] = str(node_id)
                 if isinstance(node,Literal):
-                    f.write("L %d\n" % node.literal)
-                elif isinstance(node,AndGate):
-                    child_ids = [ idmap[c.node_id] for c in node.children ]
-                    child_st = " ".join(map(str,child_ids))
-                    f.write("A %d %s\n" % (len(child_ids),child_st))
+                    buf.append("L %d\n" % node.literal)
+                    continue
+                child_st = " ".join([ idmap[c.node_id] for c in node.children ])
+                if isinstance(node,AndGate):
+                    buf.append("A %d %s\n" % (len(node.children),child_st))
                 elif isinstance(node,OrGate):
-                    child_ids = [ idmap[c.node_id] for c in node.children ]
-                    child_st = " ".join(map(str,child_ids))
-                    f.write("O %d %d %s\n" % (node.decision_var,
-                                              len(child_ids),child_st))
+                    buf.append("O %d %d %s\n" % (node.decision_var,
+                                                  len(node.children),
+                                                  child_st))
+                elif isinstance(node,NnfGate):
+                    buf.append("S %d %s %d %s\n" % (len(node.children),
+                                                     child_st,node.offset,
+                                                     node.filename))
                 else:
                     raise Exception("Nnf.save: unknown type")
+                if len(buf) >= buffer_size:
+                    f.write("".join(buf))
+                    buf.clear()
+            f.write("".join(buf))
+
+# node types of .nnf lines, parsed as ints that no literal, count or
+# node id can be (see _chunk_values)
+_L,_A,_O,_S = ( -2**62-i for i in range(4) )
+_type_codes = { 'L': _L, 'A': _A, 'O': _O, 'S': _S }
+
+def _chunk_values(chunk):
+    """returns (values,tokens), where values are the tokens of chunk
+    (whole lines of an .nnf file) as ints, and node types as their codes.
+    the chunk is parsed at once (by numpy, if available).  if the chunk
+    has S lines (with filenames) or bad tokens, it is parsed token by
+    token instead, values has None for the tokens that are not ints, and
+    tokens are the tokens (and otherwise, None)"""
+    if 'S' not in chunk:
+        text = chunk.replace('L',str(_L)).replace('A',str(_A))
+        text = text.replace('O',str(_O))
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        try:
+            if np is None:
+                return list(map(int,text.split())),None
+            with warnings.catch_warnings(): # bad tokens
+                warnings.simplefilter("error")
+                values = np.fromstring(text,dtype=np.int64,sep=' ')
+            return values.tolist(),None
+        except (ValueError,DeprecationWarning):
+            pass
+    tokens = chunk.split()
+    values = []
+    for token in tokens:
+        if token in _type_codes:
+            values.append(_type_codes[token])
+            continue
+        try:
+            values.append(int(token))
+        except ValueError:
+            values.append(None)
+    return values,tokens
 
 class NnfManager:
     def __init__(self,var_count):
@@ -481,9 +844,61 @@ class NnfManager:
             self.cache[key] = node
             return node
 
+    def to_compact(self,nnf):
+        """returns nnf as an (array-backed) CompactNnf.  nodes are added
+        in order of node_id, so from_compact rebuilds nnf with the same
+        child order"""
+        from .compact import CompactNnf, AND, OR
+
+        compact = CompactNnf(self.var_count)
+        nodes = sorted(nnf.nodes(),key=lambda node: node.node_id)
+        for node in nodes:
+            if isinstance(node,Literal):
+                alpha = compact.literal(node.literal)
+            else:
+                children = [ child._data for child in node.children ]
+                if isinstance(node,AndGate):
+                    alpha = compact.gate(AND,children)
+                elif isinstance(node,OrGate):
+                    alpha = compact.gate(OR,children,
+                                         decision_var=node.decision_var)
+                elif isinstance(node,NnfGate):
+                    alpha = compact.nnf_gate(children,node.filename)
+                else:
+                    raise Exception("NnfManager.to_compact: unknown type")
+            node._data = alpha
+        alpha = nnf.root._data
+        nnf._clear_data()
+        return compact.prune(alpha)
+
+    def from_compact(self,compact):
+        """returns a CompactNnf as an Nnf, with nodes from this manager"""
+        from .compact import LITERAL, AND, OR, NNF_GATE
+
+        nodes = [None]*(compact.root+1)
+        for i in range(compact.root+1):
+            node_type = compact.types[i]
+            children = [ nodes[c] for c in compact.child_ids(i) ]
+            if node_type == LITERAL:
+                node = self.new_node(Literal,literal=compact.data[i])
+            elif node_type == AND:
+                node = self.new_node(AndGate,children=children)
+            elif node_type == OR:
+                node = self.new_node(OrGate,children=children,
+                                     decision_var=compact.data[i])
+            elif node_type == NNF_GATE:
+                filename = compact.filenames[compact.data[i]]
+                node = self.new_node(NnfGate,children=children,
+                                     filename=filename)
+            else:
+                raise Exception("NnfManager.from_compact: unknown type")
+            nodes[i] = node
+        node_count,edge_count = node.count_and_size()
+        return Nnf(node_count,edge_count,self.var_count,node)
+
     def _reindex(self,nnf):
         index = self.var_count + 1
-        for node in nnf.root:
+        for node in nnf.nodes():
             if node.is_input():
                 node._index = node.literal
             else:
@@ -495,7 +910,7 @@ class NnfManager:
 
         clauses = []
         self._reindex(nnf)
-        for node in nnf.root:
+        for node in nnf.nodes():
             if isinstance(node,Literal):
                 me = node.literal # ACACAC
             elif isinstance(node,AndGate):
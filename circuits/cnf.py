@@ -27,6 +27,19 @@ class Cnf:
                 break
         return is_cnf_sat
 
+    def simulate(self,words,width):
+        """bit-parallel simulation (see Nnf.simulate)"""
+        mask = (1 << width)-1
+        word = mask
+        for clause in self.clauses:
+            clause_word = 0
+            for lit in clause:
+                x = words[abs(lit)]
+                clause_word |= x if lit > 0 else ~x & mask
+            word &= clause_word
+            if not word: break
+        return word
+
     def __repr__(self):
         st = "Cnf(var_count=%d,clauses=%s)" % \
             (self.var_count,str(self.clauses))
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+
+import mmap
+import struct
+import sys
+from array import array
+from .cache import default_cache
+from .data import read_lines
+
+# node types
+LITERAL,AND,OR,NNF_GATE = 0,1,2,3
+
+class CompactNnf:
+    """NNF circuits, stored as flat arrays (struct-of-arrays)
+
+    Nodes are numbered 0,1,2,... in a topological order (children
+    before parents).  For node i:
+        types[i]     is one of LITERAL, AND, OR, NNF_GATE
+        data[i]      is the literal (LITERAL), the decision variable
+                     (OR), or an index into filenames (NNF_GATE)
+        children[offsets[i]:offsets[i+1]] are the children of node i
+    The root is the last node added, unless set otherwise.
+    """
+
+    def __init__(self,var_count):
+        self.var_count = var_count
+        self.types = array('b')
+        self.data = array('q')
+        self.offsets = array('q',[0])
+        self.children = array('q')
+        self.filenames = []
+        self.root = -1
+        # unique node cache, rebuilt on demand (see _build_cache).  it
+        # takes most of the memory, so it is released once a circuit is
+        # built (see release_cache)
+        self.cache = {}
+        self._filename_ids = {}
+        self._negated = {}
+        self._neurons = {}
+        self._plan = None
+
+    def __repr__(self):
+        node_count,edge_count = self.count_and_size()
+        st = 'nnf %d %d %d' % (node_count,edge_count,self.var_count)
+        return st
+
+    def __len__(self):
+        return len(self.types)
+
+    def child_ids(self,node):
+        return self.children[self.offsets[node]:self.offsets[node+1]]
+
+    def count_and_size(self):
+        """node and edge count of the nodes stored (see prune)"""
+        return (len(self.types),len(self.children))
+
+    ########################################
+    # CONSTRUCTION (HASH-CONSING)
+    ########################################
+
+    def _build_cache(self):
+        self.cache = {}
+        for node in range(len(self.types)):
+            self.cache[self._key(node)] = node
+        self._filename_ids = { filename:i for i,filename \
+                               in enumerate(self.filenames) }
+
+    def release_cache(self):
+        """frees the unique node cache (and the negation map), which is
+        rebuilt if nodes are added later"""
+        self.cache = None
+        self._filename_ids = {}
+        self._negated = {}
+
+    def _key(self,node):
+        node_type = self.types[node]
+        if node_type == LITERAL:
+            return (LITERAL,self.data[node])
+        children = tuple(self.child_ids(node))
+        if node_type == NNF_GATE:
+            return (NNF_GATE,children,self.data[node])
+        return (node_type,children)
+
+    def _add(self,key,node_type,data,children):
+        if self.cache is None: self._build_cache()
+        if key in self.cache:
+            return self.cache[key]
+        node = len(self.types)
+        self.types.append(node_type)
+        self.data.append(data)
+        self.children.extend(children)
+        self.offsets.append(len(self.children))
+        self.cache[key] = node
+        self.root = node
+        return node
+
+    def literal(self,lit):
+        return self._add((LITERAL,lit),LITERAL,lit,())
+
+    def true(self):
+        return self.gate(AND,[])
+
+    def false(self):
+        return self.gate(OR,[])
+
+    def gate(self,node_type,children,decision_var=0):
+        """returns an AND or OR node over the given child indices"""
+        children = tuple(sorted(children))
+        return self._add((node_type,children),node_type,decision_var,children)
+
+    def nnf_gate(self,children,filename):
+        if self.cache is None: self._build_cache()
+        if filename not in self._filename_ids:
+            self._filename_ids[filename] = len(self.filenames)
+            self.filenames.append(filename)
+        index = self._filename_ids[filename]
+        children = tuple(children)
+        return self._add((NNF_GATE,children,index),NNF_GATE,index,children)
+
+    def negate(self,node):
+        """negates the sub-circuit rooted at node (iteratively)"""
+        negated = self._negated
+        stack = [node]
+        while stack:
+            cur = stack[-1]
+            if cur in negated:
+                stack.pop()
+                continue
+            node_type = self.types[cur]
+            if node_type == LITERAL:
+                stack.pop()
+                neg = self.literal(-self.data[cur])
+            elif node_type == NNF_GATE:
+                raise Exception("CompactNnf.negate: unsupported NnfGate")
+            else:
+                children = self.child_ids(cur)
+                pending = [ c for c in children if c not in negated ]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                new_type = OR if node_type == AND else AND
+                neg = self.gate(new_type,[ negated[c] for c in children ])
+            negated[cur] = neg
+            negated[neg] = cur
+        return negated[node]
+
+    def prune(self,root=None):
+        """returns a copy holding only the nodes reachable from root"""
+        if root is None: root = self.root
+        reachable = bytearray(len(self.types))
+        reachable[root] = 1
+        for node in range(root,-1,-1):
+            if not reachable[node]: continue
+            if self.types[node] == LITERAL: continue
+            for child in self.child_ids(node):
+                reachable[child] = 1
+        nnf = CompactNnf(self.var_count)
+        nnf.cache = None # no hash-consing needed, nodes are unique
+        new_ids = array('q',bytes(8*(root+1)))
+        for node in range(root+1):
+            if not reachable[node]: continue
+            new_ids[node] = len(nnf.types)
+            nnf.types.append(self.types[node])
+            nnf.data.append(self.data[node])
+            if self.types[node] != LITERAL:
+                nnf.children.extend(new_ids[c] for c in self.child_ids(node))
+            nnf.offsets.append(len(nnf.children))
+        nnf.filenames = list(self.filenames)
+        nnf.root = len(nnf.types)-1
+        return nnf
+
+    ########################################
+    # QUERIES & TRANSFORMATIONS
+    ########################################
+
+    def _level_plan(self):
+        """groups the nodes up to the root by level, as NumPy index
+        arrays, so that a level of AND (or OR) gates is evaluated with one
+        array operation.  a node is placed in the level after its last
+        child is placed (as in a topological sort, using the CSR arrays
+        of the parents of each node).  returns (literals,true,levels),
+        where literals is (ids,variables,signs), true are the ids of the
+        true constants, and each level is (ands,ors,nnf_gates).  the plan
+        is cached until nodes are added or the root changes"""
+        import numpy as np
+
+        key = (self.root,len(self.types))
+        if self._plan is not None and self._plan[0] == key:
+            return self._plan[1]
+        n = self.root+1
+        types = np.asarray(self.types[:n],dtype=np.int8)
+        data = np.asarray(self.data[:n],dtype=np.int64)
+        offsets = np.asarray(self.offsets[:n+1],dtype=np.int64)
+        children = np.asarray(self.children[:int(offsets[-1])],dtype=np.int64)
+        sizes = np.diff(offsets)
+        order = np.argsort(children)
+        parents = np.repeat(np.arange(n),sizes)[order]
+        parent_offsets = np.zeros(n+1,dtype=np.int64)
+        np.cumsum(np.bincount(children,minlength=n),out=parent_offsets[1:])
+
+        def gates(ids,node_type):
+            ids = ids[types[ids] == node_type]
+            if len(ids) == 0: return None
+            child_ids = children[_ranges(offsets[ids],offsets[ids+1])]
+            starts = np.cumsum(sizes[ids]) - sizes[ids]
+            return (ids,child_ids,starts)
+
+        frontier = np.flatnonzero(sizes == 0)
+        ids = frontier[types[frontier] == LITERAL]
+        literals = (ids,np.abs(data[ids]),data[ids] > 0)
+        true = frontier[types[frontier] == AND]
+        levels = []
+        remaining = sizes.copy()
+        while len(frontier):
+            if levels:
+                ands,ors = gates(frontier,AND),gates(frontier,OR)
+            else: # literals and constants
+                ands = ors = None
+            nnf_gates = [ (node,children[offsets[node]:offsets[node+1]])
+                          for node in frontier[types[frontier] == NNF_GATE] ]
+            levels.append((ands,ors,nnf_gates))
+            edges = _ranges(parent_offsets[frontier],parent_offsets[frontier+1])
+            ready,hits = np.unique(parents[edges],return_counts=True)
+            remaining[ready] -= hits
+            frontier = ready[remaining[ready] == 0]
+        plan = (literals,true,levels)
+        self._plan = (key,plan)
+        return plan
+
+    def model_count(self):
+        """model count, assuming the circuit is a d-DNNF.  the circuit is
+        evaluated level by level (see _level_plan), with the counts as
+        Python ints (in NumPy object arrays), and the variables below
+        each node as a bitset of 64-bit words"""
+        import numpy as np
+
+        (lits,lit_vars,_),true,levels = self._level_plan()
+        root = self.root
+        words = np.zeros((root+1,(self.var_count >> 6) + 1),dtype=np.uint64)
+        bits = np.left_shift(np.uint64(1),(lit_vars & 63).astype(np.uint64))
+        words[lits,lit_vars >> 6] = bits
+        var_counts = np.zeros(root+1,dtype=np.int64)
+        var_counts[lits] = 1
+        counts = np.zeros(root+1,dtype=object)
+        counts[lits] = 1
+        counts[true] = 1
+        for ands,ors,nnf_gates in levels:
+            if nnf_gates:
+                raise Exception("CompactNnf.model_count: unknown type")
+            if ands is not None:
+                ids,child_ids,starts = ands
+                counts[ids] = np.multiply.reduceat(counts[child_ids],starts)
+                words[ids] = np.bitwise_or.reduceat(words[child_ids],starts,
+                                                    axis=0)
+                var_counts[ids] = _popcounts(words[ids])
+            if ors is not None:
+                ids,child_ids,starts = ors
+                words[ids] = np.bitwise_or.reduceat(words[child_ids],starts,
+                                                    axis=0)
+                var_counts[ids] = _popcounts(words[ids])
+                sizes = np.diff(np.append(starts,len(child_ids)))
+                gaps = np.repeat(var_counts[ids],sizes) - var_counts[child_ids]
+                counts[ids] = np.add.reduceat(counts[child_ids] << gaps,starts)
+        gap_size = self.var_count - int(var_counts[root])
+        return int(counts[root]) << gap_size
+
+    def _neuron(self,filename,precision,ordering=None):
+        """the compiled neuron of an NNF_GATE, as a CompactNnf"""
+        if ordering is not None and not isinstance(ordering,str):
+            ordering = tuple(ordering) # an explicit order (see cache.key)
+        key = (filename,precision,ordering)
+        if key not in self._neurons:
+            manager,nnf = default_cache.get(filename,precision,ordering)
+            self._neurons[key] = manager.to_compact(nnf)
+        return self._neurons[key]
+
+    def is_model(self,inst,precision=2):
+        """evaluates the circuit level by level (see _level_plan)"""
+        # inst is a map: var_index -> {0,1}
+        import numpy as np
+
+        (lits,lit_vars,lit_signs),true,levels = self._level_plan()
+        values = np.zeros(self.root+1,dtype=bool)
+        inputs = np.fromiter(( inst[var] for var in lit_vars.tolist() ),
+                             dtype=np.int8,count=len(lits))
+        values[lits] = np.where(lit_signs,inputs == 1,inputs == 0)
+        values[true] = True
+        for ands,ors,nnf_gates in levels:
+            if ands is not None:
+                ids,child_ids,starts = ands
+                values[ids] = np.logical_and.reduceat(values[child_ids],starts)
+            if ors is not None:
+                ids,child_ids,starts = ors
+                values[ids] = np.logical_or.reduceat(values[child_ids],starts)
+            for node,child_ids in nnf_gates:
+                filename = self.filenames[self.data[node]]
+                neuron = self._neuron(filename,precision)
+                nnf_inst = [0] + values[child_ids].tolist()
+                values[node] = neuron.is_model(nnf_inst)
+        return int(values[self.root])
+
+    def simulate(self,words,width,precision=2):
+        """bit-parallel simulation (see Nnf.simulate)"""
+        mask = (1 << width)-1
+        root = self.root
+        types,children,offsets = self.types,self.children,self.offsets
+        node_words = [0]*(root+1)
+        for node in range(root+1):
+            node_type = types[node]
+            first,last = offsets[node],offsets[node+1]
+            if node_type == LITERAL:
+                lit = self.data[node]
+                word = words[abs(lit)]
+                if lit < 0: word = ~word & mask
+            elif node_type == AND:
+                word = mask
+                for child in children[first:last]:
+                    word &= node_words[child]
+            elif node_type == OR:
+                word = 0
+                for child in children[first:last]:
+                    word |= node_words[child]
+            elif node_type == NNF_GATE:
+                filename = self.filenames[self.data[node]]
+                neuron = self._neuron(filename,precision)
+                inputs = [0] + [ node_words[c] for c in children[first:last] ]
+                word = neuron.simulate(inputs,width)
+            else:
+                raise Exception("CompactNnf.simulate: unknown type")
+            node_words[node] = word
+        return node_words[root]
+
+    def flatten(self,precision=2,ordering=None):
+        """flatten NNF_GATE's to AND/OR gates, returning a new CompactNnf.
+        neurons are compiled with the given variable ordering"""
+        flat = CompactNnf(self.var_count)
+        new_ids = array('q',bytes(8*(self.root+1)))
+        for node in range(self.root+1):
+            node_type = self.types[node]
+            child_ids = [ new_ids[c] for c in self.child_ids(node) ]
+            if node_type == LITERAL:
+                alpha = flat.literal(self.data[node])
+            elif node_type == NNF_GATE:
+                filename = self.filenames[self.data[node]]
+                neuron = self._neuron(filename,precision,ordering)
+                alpha = flat.splice(neuron,child_ids)
+            else:
+                alpha = flat.gate(node_type,child_ids)
+            new_ids[node] = alpha
+        return flat.prune(alpha)
+
+    def splice(self,nnf,inputs):
+        """copies the CompactNnf nnf into this one, where variable i of
+        nnf is replaced by the node inputs[i-1].  returns the new root"""
+        inputs = [None] + list(inputs)
+        new_ids = array('q',bytes(8*(nnf.root+1)))
+        for node in range(nnf.root+1):
+            node_type = nnf.types[node]
+            if node_type == LITERAL:
+                lit = nnf.data[node]
+                alpha = inputs[abs(lit)]
+                if lit < 0: alpha = self.negate(alpha)
+            elif node_type == NNF_GATE:
+                raise Exception("CompactNnf.splice: unexpected NnfGate")
+            else:
+                child_ids = [ new_ids[c] for c in nnf.child_ids(node) ]
+                alpha = self.gate(node_type,child_ids)
+            new_ids[node] = alpha
+        return alpha
+
+    def binarize(self):
+        """convert all AND/OR gates to have 0 or 2 inputs."""
+        nnf = CompactNnf(self.var_count)
+        new_ids = array('q',bytes(8*(self.root+1)))
+        for node in range(self.root+1):
+            node_type = self.types[node]
+            child_ids = [ new_ids[c] for c in self.child_ids(node) ]
+            if node_type == LITERAL:
+                alpha = nnf.literal(self.data[node])
+            elif node_type == NNF_GATE:
+                raise Exception("CompactNnf.binarize: unexpected NnfGate")
+            elif len(child_ids) == 1:
+                sibling = nnf.gate(node_type,[])
+                alpha = nnf.gate(node_type,[child_ids[0],sibling])
+            elif len(child_ids) <= 2:
+                alpha = nnf.gate(node_type,child_ids)
+            else:
+                alpha = child_ids[0]
+                for child in child_ids[1:]:
+                    alpha = nnf.gate(node_type,[alpha,child])
+            new_ids[node] = alpha
+        return nnf.prune(alpha)
+
+    ########################################
+    # I/O
+    ########################################
+
+    @staticmethod
+    def read(filename):
+        """read an NNF from a (text) .nnf file (see Nnf.read)"""
+        lines = read_lines(filename)
+        header = next(lines,"").split()
+        if len(header) != 4 or header[0] != 'nnf':
+            raise Exception("CompactNnf.read: expected header: nnf N E V")
+        node_count,edge_count,var_count = map(int,header[1:])
+        nnf = CompactNnf(var_count)
+        node_ids = array('q',bytes(8*node_count))
+        file_id,my_edge_count = 0,0
+        for line in lines:
+            line = line.split()
+            if not line: continue
+            if file_id >= node_count:
+                msg = "more than %d nodes" % node_count
+                raise Exception("CompactNnf.read: %s" % msg)
+            if line[0] == 'L':
+                literal = int(line[1])
+                if not 0 < abs(literal) <= var_count:
+                    msg = "literal %d out of range" % literal
+                    raise Exception("CompactNnf.read: %s" % msg)
+                node = nnf.literal(literal)
+            else:
+                if line[0] == 'A':
+                    first,last = 2,len(line)
+                elif line[0] == 'O':
+                    first,last = 3,len(line)
+                elif line[0] == 'S':
+                    first,last = 2,len(line)-2
+                else:
+                    msg = "unknown type %s" % line[0]
+                    raise Exception("CompactNnf.read: %s" % msg)
+                child_count = int(line[first-1])
+                child_ids = list(map(int,line[first:last]))
+                if len(child_ids) != child_count or \
+                   (child_ids and not 0 <= min(child_ids) <= \
+                    max(child_ids) < file_id):
+                    msg = "bad children on line %d" % (file_id+2)
+                    raise Exception("CompactNnf.read: %s" % msg)
+                children = [ node_ids[child_id] for child_id in child_ids ]
+                my_edge_count += child_count
+                if line[0] == 'A':
+                    node = nnf.gate(AND,children)
+                elif line[0] == 'O':
+                    node = nnf.gate(OR,children,decision_var=int(line[1]))
+                else:
+                    node = nnf.nnf_gate(children,line[-1])
+            node_ids[file_id] = node
+            file_id += 1
+        if file_id != node_count or my_edge_count != edge_count:
+            msg = "found %d nodes and %d edges, expected %d and %d" % \
+                  (file_id,my_edge_count,node_count,edge_count)
+            raise Exception("CompactNnf.read: %s" % msg)
+        nnf.root = node
+        nnf.release_cache()
+        return nnf
+
+    def save(self,filename,buffer_size=2**16):
+        """save as an .nnf file.  only the nodes reachable from the root
+        are saved, so the root is the last line"""
+        nnf = self if self.root == len(self.types)-1 else self.prune()
+        node_count,edge_count = nnf.count_and_size()
+        types,data = nnf.types.tolist(),nnf.data.tolist()
+        offsets = nnf.offsets.tolist()
+        children = list(map(str,nnf.children.tolist()))
+        with open(filename,'w',buffering=2**20) as f:
+            f.write("nnf %d %d %d\n" % (node_count,edge_count,self.var_count))
+            buf = []
+            for node,node_type in enumerate(types):
+                if node_type == LITERAL:
+                    buf.append("L %d\n" % data[node])
+                    continue
+                first,last = offsets[node],offsets[node+1]
+                child_st = " ".join(children[first:last])
+                if node_type == AND:
+                    buf.append("A %d %s\n" % (last-first,child_st))
+                elif node_type == OR:
+                    buf.append("O %d %d %s\n" % (data[node],last-first,
+                                                  child_st))
+                elif node_type == NNF_GATE:
+                    buf.append("S %d %s 0 %s\n" % (last-first,child_st,
+                                                    nnf.filenames[data[node]]))
+                else:
+                    raise Exception("CompactNnf.save: unknown type")
+                if len(buf) >= buffer_size:
+                    f.write("".join(buf))
+                    buf.clear()
+            f.write("".join(buf))
+
+    ########################################
+    # BINARY I/O
+    ########################################
+
+    # header: magic, version, var_count, node_count, edge_count, root,
+    # and the byte length of the string table
+    _header = struct.Struct("<4sIqqqqq")
+    _magic = b"NNFB"
+    _version = 1
+
+    def save_binary(self,filename):
+        """save in the binary NNF format: a header, followed by the
+        node type, data, offsets and children arrays, and then the
+        string table of NnfGate filenames (one per line).  arrays are
+        little-endian and padded to 8-byte boundaries"""
+        nnf = self if self.root == len(self.types)-1 else self.prune()
+        node_count,edge_count = nnf.count_and_size()
+        strings = "\n".join(nnf.filenames).encode("utf-8")
+        header = CompactNnf._header.pack(CompactNnf._magic,
+                                         CompactNnf._version,
+                                         nnf.var_count,node_count,
+                                         edge_count,nnf.root,len(strings))
+        with open(filename,'wb') as f:
+            f.write(header)
+            types = bytes(array('b',nnf.types))
+            f.write(types + bytes(-len(types) % 8))
+            for values in (nnf.data,nnf.offsets,nnf.children):
+                values = array('q',values)
+                if sys.byteorder == "big": values.byteswap()
+                f.write(values.tobytes())
+            f.write(strings)
+
+    @staticmethod
+    def read_binary(filename):
+        """load an NNF saved by save_binary.  the file is memory-mapped
+        and the arrays are views into the mapping (no copying), so the
+        result is read-only: use it as the input to flatten, binarize,
+        prune, etc., which build new circuits"""
+        with open(filename,'rb') as f:
+            mm = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        header_size = CompactNnf._header.size
+        magic,version,var_count,node_count,edge_count,root,string_size = \
+            CompactNnf._header.unpack_from(mm,0)
+        if magic != CompactNnf._magic or version != CompactNnf._version:
+            msg = "%s is not a binary NNF file" % filename
+            raise Exception("CompactNnf.read_binary: %s" % msg)
+
+        view = memoryview(mm)
+        start = header_size
+        nnf = CompactNnf(var_count)
+        nnf.types = view[start:start+node_count].cast('b')
+        start += node_count + (-node_count % 8)
+        arrays = []
+        for size in (node_count,node_count+1,edge_count):
+            values = view[start:start+8*size]
+            if sys.byteorder == "big": # copy, to swap bytes
+                values = array('q',values.tobytes())
+                values.byteswap()
+            else:
+                values = values.cast('q')
+            arrays.append(values)
+            start += 8*size
+        nnf.data,nnf.offsets,nnf.children = arrays
+        strings = bytes(view[start:start+string_size]).decode("utf-8")
+        nnf.filenames = strings.split("\n") if strings else []
+        nnf.root = root
+        nnf.cache = None
+        nnf._mmap = mm # keep the mapping alive
+        return nnf
+
+def _ranges(starts,ends):
+    """the concatenation of the ranges [starts[i],ends[i]), as an
+    index array"""
+    import numpy as np
+    sizes = ends - starts
+    shifts = np.repeat(starts - (np.cumsum(sizes) - sizes),sizes)
+    return np.arange(int(sizes.sum()),dtype=np.int64) + shifts
+
+def _popcounts(words):
+    """the number of bits set in each row of words (uint64)"""
+    import numpy as np
+    if hasattr(np,"bitwise_count"): # numpy >= 2.0
+        return np.bitwise_count(words).sum(axis=1,dtype=np.int64)
+    bits = np.unpackbits(words.view(np.uint8),axis=1)
+    return bits.sum(axis=1,dtype=np.int64)
+
+def text_to_binary(nnf_filename,binary_filename):
+    """converts a text .nnf file to the binary NNF format"""
+    CompactNnf.read(nnf_filename).save_binary(binary_filename)
+
+def binary_to_text(binary_filename,nnf_filename):
+    """converts a binary NNF file to the text .nnf format"""
+    CompactNnf.read_binary(binary_filename).save(nnf_filename)
+
+def obdd_to_compact(manager,root):
+    """converts an OBDD to a CompactNnf (as in ObddManager.obdd_to_nnf)"""
+    nnf = CompactNnf(manager.var_count)
+    for node in root.__iter__(clear_data=True):
+        if node.is_terminal():
+            alpha = nnf.true() if node.is_true() else nnf.false()
+        else:
+            dvar = node.dvar
+            plit,nlit = nnf.literal(dvar),nnf.literal(-dvar)
+            hi = nnf.gate(AND,[plit,node.hi.data])
+            lo = nnf.gate(AND,[nlit,node.lo.data])
+            alpha = nnf.gate(OR,[hi,lo])
+        node.data = alpha
+    return nnf.prune(alpha)
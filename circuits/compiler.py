@@ -1,236 +1,312 @@
 #!/usr/bin/env python3
 
 import sys
+import heapq
 from collections import defaultdict
 from .circuits import Literal, AndGate, OrGate, Nnf
+from .scheduler import AutoScheduler, AdaptiveScheduler
+from .telemetry import get_telemetry
 
-class Verbose:
-    """helper to print out update messages during compilation"""
-    def __init__(self,nnf,verbose):
-        self.nnf = nnf
-        self.verbose = verbose
-        self.count = 0
-        self.node_count = self.nnf.root.count()
-
-    def __enter__(self):
-        print("count %d:\n" % self.node_count)
-        return self
-
-    def __exit__(self,type,value,traceback):
-        pass
-
-    def update(self):
-        self.count += 1
-        if not self.verbose: return
-        if (self.count >= .999*self.node_count) or \
-           (self.count >=  .99*self.node_count and self.count % 50 == 0)  or \
-           (self.count >=   .9*self.node_count and self.count % 500 == 0) or \
-            self.count % 5000 == 0:
-            print(" %d" % self.count,flush=True)
-
-def compile_nnf(nnf,mgr,verbose=False):
-    with Verbose(nnf,verbose) as v:
-        for node in nnf.root.__iter__(clear_data=True):
-            if isinstance(node,Literal):
-                alpha = mgr.literal(node.literal)
-            elif isinstance(node,AndGate):
-                alpha = mgr.true()
-                for child in node.children:
-                    alpha = alpha & child._data
-            elif isinstance(node,OrGate):
-                alpha = mgr.false()
-                for child in node.children:
-                    alpha = alpha | child._data
-            else:
-                raise Exception("compiling: unknown type")
-            node._data = alpha
-            v.update()
+############################################################
+# combining the children of a gate
+############################################################
+
+# A combine policy combines the (compiled) children of an AndGate or
+# OrGate.  It is given operands, the SDDs of the children in the order
+# of node.children, which are dereferenced as they are used if deref
+# (each is referenced once for this parent).  Intermediate results are
+# referenced while other operands are combined, and reported to the
+# telemetry.  The result is returned unreferenced.
+
+def _size(alpha):
+    """the size of an SDD (or the node count of an OBDD)"""
+    return alpha.size() if hasattr(alpha,"size") else alpha.count()
+
+def _apply(node,alpha,beta):
+    return alpha & beta if isinstance(node,AndGate) else alpha | beta
+
+def _unit(mgr,node):
+    return mgr.true() if isinstance(node,AndGate) else mgr.false()
+
+def _combine_linear(mgr,node,operands,t,deref):
+    """folds the operands left to right"""
+    alpha = _unit(mgr,node)
+    last = len(operands)-1
+    for i,beta in enumerate(operands):
+        alpha = _apply(node,alpha,beta)
+        if deref: beta.deref()
+        if i < last: t.intermediate(alpha)
     return alpha
 
-def compile_nnf_automatic(nnf,mgr,verbose=False):
+def _combine_balanced(mgr,node,operands,t,deref):
+    """combines the operands pairwise, as a balanced tree"""
+    if not operands: return _unit(mgr,node)
+    items = [ (beta,deref) for beta in operands ] # (sdd,release it)
+    while len(items) > 1:
+        next_items = []
+        for i in range(0,len(items)-1,2):
+            (alpha,release_alpha),(beta,release_beta) = items[i],items[i+1]
+            gamma = _apply(node,alpha,beta)
+            gamma.ref()
+            if release_alpha: alpha.deref()
+            if release_beta: beta.deref()
+            if len(items) > 2: t.intermediate(gamma)
+            next_items.append((gamma,True))
+        if len(items) % 2: next_items.append(items[-1])
+        items = next_items
+    alpha,release = items[0]
+    if release: alpha.deref()
+    return alpha
+
+def _combine_smallest(mgr,node,operands,t,deref):
+    """repeatedly combines the two smallest operands (a priority queue
+    keyed on SDD size)"""
+    if not operands: return _unit(mgr,node)
+    heap = [ (_size(beta),i,beta,deref) for i,beta in enumerate(operands) ]
+    heapq.heapify(heap)
+    index = len(heap)
+    while len(heap) > 1:
+        _,_,alpha,release_alpha = heapq.heappop(heap)
+        _,_,beta,release_beta = heapq.heappop(heap)
+        gamma = _apply(node,alpha,beta)
+        gamma.ref()
+        if release_alpha: alpha.deref()
+        if release_beta: beta.deref()
+        size = _size(gamma)
+        if heap: t.intermediate(gamma,size)
+        heapq.heappush(heap,(size,index,gamma,True))
+        index += 1
+    _,_,alpha,release = heap[0]
+    if release: alpha.deref()
+    return alpha
+
+COMBINE_POLICIES = {
+    "linear": _combine_linear,
+    "balanced": _combine_balanced,
+    "smallest": _combine_smallest,
+}
+
+def _combiner(combine):
+    if combine not in COMBINE_POLICIES:
+        raise Exception("compiling: unknown combine policy %s" % combine)
+    return COMBINE_POLICIES[combine]
+
+def _compile_gate(mgr,node,combiner,t,deref):
+    """compiles an AndGate or OrGate, whose children are compiled"""
+    if not isinstance(node,(AndGate,OrGate)):
+        raise Exception("compiling: unknown type")
+    operands = [ child._data for child in node.children ]
+    return combiner(mgr,node,operands,t,deref)
+
+############################################################
+# compilers
+############################################################
+
+def compile_nnf(nnf,mgr,verbose=False,scheduler=None,telemetry=None,
+                combine="linear"):
+    """compiles nnf bottom-up, where mgr is an SddManager or an
+    ObddManager.  results are not referenced, so with a scheduler (see
+    circuits.scheduler), this is compile_nnf_manual.  a Telemetry records
+    the compilation (see circuits.telemetry).  the children of each gate
+    are combined by the policy combine, a key of COMBINE_POLICIES"""
+    if scheduler is not None:
+        return compile_nnf_manual(nnf,mgr,verbose=verbose,scheduler=scheduler,
+                                  telemetry=telemetry,combine=combine)
+    combiner = _combiner(combine)
+    t = get_telemetry(telemetry,verbose)
+    t.start(nnf,mgr,"plain",verbose=verbose)
+    for node in nnf.nodes():
+        t.begin()
+        if isinstance(node,Literal):
+            alpha = mgr.literal(node.literal)
+        else:
+            alpha = _compile_gate(mgr,node,combiner,t,False)
+        node._data = alpha
+        t.node(node,alpha,mgr)
+    nnf._clear_data()
+    t.finish(mgr,alpha)
+    return alpha
+
+def _compile_post_order(nnf,mgr,scheduler,checkpoint,t,combiner,start=0):
+    """compiles the nodes of nnf from position start of its post-order,
+    where the results of earlier nodes that are still needed are in
+    node._data, referenced once per remaining parent.  returns the
+    result of the root"""
+    nodes = nnf.nodes()
+    for position in range(start,len(nodes)):
+        node = nodes[position]
+        t.begin()
+        if isinstance(node,Literal):
+            alpha = mgr.literal(node.literal)
+        else:
+            alpha = _compile_gate(mgr,node,combiner,t,True)
+        for _ in range(node._ref_count): alpha.ref()
+        node._data = alpha
+        t.node(node,alpha,mgr)
+        scheduler.step(mgr)
+        if checkpoint is not None: checkpoint.step(nnf,mgr,position+1)
+    return nnf.root._data
+
+def compile_nnf_automatic(nnf,mgr,verbose=False,scheduler=None,
+                          checkpoint=None,telemetry=None,combine="linear"):
+    """compiles nnf bottom-up, by default with the manager's automatic
+    garbage collection and minimization (see AutoScheduler).  if given a
+    Checkpointer, checkpoints periodically (see circuits.checkpoint)"""
+    if scheduler is None: scheduler = AutoScheduler()
     nnf._prime_ref_count()
-    mgr.auto_gc_and_minimize_on()
+    scheduler.start(mgr)
+    if checkpoint is not None: checkpoint.start(nnf,mgr,"automatic")
+    t = get_telemetry(telemetry,verbose)
+    t.start(nnf,mgr,"automatic",scheduler,verbose)
 
-    with Verbose(nnf,verbose) as v:
-        for node in nnf.root.__iter__(clear_data=True):
-            if isinstance(node,Literal):
-                alpha = mgr.literal(node.literal)
-            elif isinstance(node,AndGate):
-                alpha = mgr.true()
-                for child in node.children:
-                    alpha = alpha & child._data
-                    child._data.deref()
-            elif isinstance(node,OrGate):
-                alpha = mgr.false()
-                for child in node.children:
-                    alpha = alpha | child._data
-                    child._data.deref()
-            else:
-                raise Exception("compiling: unknown type")
-            for _ in range(node._ref_count): alpha.ref()
-            node._data = alpha
-            v.update()
+    alpha = _compile_post_order(nnf,mgr,scheduler,checkpoint,t,
+                                _combiner(combine))
+    nnf._clear_data()
 
-    mgr.auto_gc_and_minimize_off()
+    scheduler.finish(mgr)
     alpha.deref()
+    t.finish(mgr,alpha)
     return alpha
 
-def compile_nnf_manual(nnf,mgr,verbose=False):
+def compile_nnf_manual(nnf,mgr,verbose=False,scheduler=None,checkpoint=None,
+                       telemetry=None,combine="linear"):
+    """compiles nnf bottom-up, by default garbage collecting and
+    minimizing as decided by an AdaptiveScheduler.  if given a
+    Checkpointer, checkpoints periodically (see circuits.checkpoint)"""
+    if scheduler is None: scheduler = default_manual_scheduler(verbose)
     nnf._prime_ref_count()
-    #gc_last_size = 2**14
-    #min_last_size = 2**14
-    gc_last_size = 34000
-    min_last_size = 34000
-
-    with Verbose(nnf,verbose) as v:
-        for node in nnf.root.__iter__(clear_data=True):
-            if isinstance(node,Literal):
-                alpha = mgr.literal(node.literal)
-            elif isinstance(node,AndGate):
-                alpha = mgr.true()
-                for child in node.children:
-                    alpha = alpha & child._data
-                    child._data.deref()
-            elif isinstance(node,OrGate):
-                alpha = mgr.false()
-                for child in node.children:
-                    alpha = alpha | child._data
-                    child._data.deref()
-            else:
-                raise Exception("compiling: unknown type")
-            for _ in range(node._ref_count): alpha.ref()
-            node._data = alpha
+    scheduler.start(mgr)
+    if checkpoint is not None: checkpoint.start(nnf,mgr,"manual")
+    t = get_telemetry(telemetry,verbose)
+    t.start(nnf,mgr,"manual",scheduler,verbose)
 
-            if mgr.dead_count() >= 2*gc_last_size:
-                print('+',end='',flush=True)
-                gc_last_size = 2*gc_last_size
-                mgr.garbage_collect()
-            if mgr.live_count() >= 2*min_last_size:
-                print('*',end='',flush=True)
-                min_last_size = 2*min_last_size
-                mgr.minimize_limited()
-            v.update()
+    alpha = _compile_post_order(nnf,mgr,scheduler,checkpoint,t,
+                                _combiner(combine))
+    nnf._clear_data()
 
+    scheduler.finish(mgr)
     alpha.deref()
+    t.finish(mgr,alpha)
     return alpha
 
-def _compile_nnf_recursive(node,mgr,v):
+def default_manual_scheduler(verbose=False):
+    return AdaptiveScheduler(gc_threshold=68000,minimize_threshold=68000,
+                             verbose=verbose)
+
+def _compile_nnf_recursive(node,mgr,t,scheduler,combiner):
     if node._data is not None:
         return node._data
+    t.begin()
     if isinstance(node,Literal):
         alpha = mgr.literal(node.literal)
-    elif isinstance(node,AndGate):
-        alpha = mgr.true()
-        for child in node.children:
-            alpha.ref()
-            beta = _compile_nnf_recursive(child,mgr,v)
-            alpha.deref()
-            alpha = alpha & beta
-            beta.deref()
-    elif isinstance(node,OrGate):
-        alpha = mgr.false()
+    elif combiner is not _combine_linear:
+        # compile the children, then combine them
         for child in node.children:
+            _compile_nnf_recursive(child,mgr,t,scheduler,combiner)
+        alpha = _compile_gate(mgr,node,combiner,t,True)
+    elif isinstance(node,(AndGate,OrGate)):
+        # fold each child in as soon as it is compiled
+        alpha = _unit(mgr,node)
+        last = len(node.children)-1
+        for i,child in enumerate(node.children):
             alpha.ref()
-            beta = _compile_nnf_recursive(child,mgr,v)
+            beta = _compile_nnf_recursive(child,mgr,t,scheduler,combiner)
             alpha.deref()
-            alpha = alpha | beta
+            alpha = _apply(node,alpha,beta)
             beta.deref()
+            if i < last: t.intermediate(alpha)
     else:
         raise Exception("compiling: unknown type")
-    v.update()
     for _ in range(node._ref_count): alpha.ref()
     node._data = alpha
+    t.node(node,alpha,mgr)
+    scheduler.step(mgr)
     return alpha
 
-def compile_nnf_recursive(nnf,mgr,verbose=False):
-    v = Verbose(nnf,verbose)
+def compile_nnf_recursive(nnf,mgr,verbose=False,scheduler=None,
+                          telemetry=None,combine="linear"):
+    """compiles nnf top-down (recursively), by default with the manager's
+    automatic garbage collection and minimization (see AutoScheduler).
+    with the linear policy, children are folded in as they are compiled;
+    with the others, they are combined once all are compiled"""
+    combiner = _combiner(combine)
+    if scheduler is None: scheduler = AutoScheduler()
     nnf._prime_ref_count()
-    mgr.auto_gc_and_minimize_on()
-    root = _compile_nnf_recursive(nnf.root,mgr,v)
-    mgr.auto_gc_and_minimize_off()
+    scheduler.start(mgr)
+    t = get_telemetry(telemetry,verbose)
+    t.start(nnf,mgr,"recursive",scheduler,verbose)
+    root = _compile_nnf_recursive(nnf.root,mgr,t,scheduler,combiner)
+    scheduler.finish(mgr)
     root.deref()
-    # ACACAC: clear data
+    nnf._clear_data()
+    t.finish(mgr,root)
     return root
 
 ############################################################
 # experimental
 ############################################################
 
-def label_nodes_by_depth(node,depth=0):
-    if hasattr(node,'_depth'):
-        node._depth = max(node._depth,depth)
-        return
-    else:
-        node._depth = depth
-    depth = node._depth # the deepest depth of this node found
-    if isinstance(node,Literal):
-        pass
-    elif isinstance(node,AndGate):
-        for child in node.children:
-            label_nodes_by_depth(child,depth=depth+1)
-    elif isinstance(node,OrGate):
-        for child in node.children:
-            label_nodes_by_depth(child,depth=depth+1)
-    else:
-        raise Exception("compiling: unknown type")
+def label_nodes_by_depth(nnf):
+    """labels each node with the length of the longest path to it from
+    the root.  visits parents before children (reverse topological
+    order), so each node is labeled once"""
+    nodes = nnf.nodes()
+    for node in nodes:
+        node._depth = 0
+    for node in reversed(nodes):
+        depth = node._depth + 1
+        if isinstance(node,Literal):
+            pass
+        elif isinstance(node,(AndGate,OrGate)):
+            for child in node.children:
+                if child._depth < depth: child._depth = depth
+        else:
+            raise Exception("compiling: unknown type")
 
 def bucket_nodes_by_depth(nnf):
-    label_nodes_by_depth(nnf.root)
+    label_nodes_by_depth(nnf)
     buckets = defaultdict(set)
-    for node in nnf.root:
+    for node in nnf.nodes():
         depth = node._depth
         buckets[depth].add(node)
     return buckets
 
-def compile_nnf_recursive_by_depth(nnf,mgr,verbose=False):
-    #mgr.auto_gc_and_minimize_on()
+def compile_nnf_recursive_by_depth(nnf,mgr,verbose=False,scheduler=None,
+                                   telemetry=None,combine="linear"):
+    """compiles nnf bottom-up, deepest nodes first, by default garbage
+    collecting and minimizing as decided by an AdaptiveScheduler"""
+    combiner = _combiner(combine)
+    if scheduler is None:
+        scheduler = AdaptiveScheduler(gc_threshold=2**16,
+                                      minimize_threshold=2**16,
+                                      verbose=verbose)
     nnf._prime_ref_count()
-    gc_limit = 2**15
-    min_limit = 2**15
+    scheduler.start(mgr)
+    t = get_telemetry(telemetry,verbose)
+    t.start(nnf,mgr,"recursive_by_depth",scheduler,verbose)
 
     buckets = bucket_nodes_by_depth(nnf)
     depths = reversed(sorted(buckets.keys()))
-    with Verbose(nnf,verbose) as v:
-        for depth in depths:
-            bucket = buckets[depth]
-            print("depth: %d (%d nodes)" % (depth,len(bucket)))
-            for node in bucket:
-                if isinstance(node,Literal):
-                    alpha = mgr.literal(node.literal)
-                elif isinstance(node,AndGate):
-                    alpha = mgr.true()
-                    for child in node.children:
-                        alpha = alpha & child._data
-                        child._data.deref()
-                elif isinstance(node,OrGate):
-                    alpha = mgr.false()
-                    for child in node.children:
-                        alpha = alpha | child._data
-                        child._data.deref()
-                else:
-                    raise Exception("compiling: unknown type")
-                for _ in range(node._ref_count): alpha.ref()
-                node._data = alpha
-
-                v.update()
-                if mgr.dead_count() >= 2*gc_limit:
-                    print('+',end='',flush=True)
-                    print("live count:", mgr.live_count())
-                    print("dead count:", mgr.dead_count())
-                    #gc_limit = 2*gc_limit
-                    mgr.garbage_collect()
-                if mgr.live_count() >= 2*min_limit:
-                    print('*',end='',flush=True)
-                    print("live count:", mgr.live_count())
-                    print("dead count:", mgr.dead_count())
-                    #min_limit = 2*min_limit
-                    mgr.minimize_limited()
-            print("live count:", mgr.live_count())
-            print("dead count:", mgr.dead_count())
-
-    for node in nnf.root.__iter__(clear_data=True):
-        del node._depth
-    #mgr.auto_gc_and_minimize_off()
+    for depth in depths:
+        bucket = buckets[depth]
+        for node in bucket:
+            t.begin()
+            if isinstance(node,Literal):
+                alpha = mgr.literal(node.literal)
+            else:
+                alpha = _compile_gate(mgr,node,combiner,t,True)
+            for _ in range(node._ref_count): alpha.ref()
+            node._data = alpha
+            t.node(node,alpha,mgr)
+
+            scheduler.step(mgr)
+        t.depth(depth,len(bucket),mgr)
+
+    for node in nnf.nodes():
+        node._depth = None
+    nnf._clear_data()
+    scheduler.finish(mgr)
+    t.finish(mgr,alpha)
     return alpha
 
 ############################################################
@@ -1,4 +1,36 @@
 
+def read_chunks(filename,chunk_size=2**22):
+    """generator over the text of a file, in chunks of about chunk_size
+    characters, each ending at the end of a line"""
+    with open(filename,'r') as f:
+        rest = ""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk: break
+            end = chunk.rfind("\n") + 1
+            if end == 0:
+                rest += chunk
+                continue
+            yield rest + chunk[:end]
+            rest = chunk[end:]
+        if rest:
+            yield rest
+
+def read_lines(filename,chunk_size=2**22):
+    """generator over the lines of a text file, which is read in chunks
+    of chunk_size characters (lines are yielded without newlines)"""
+    with open(filename,'r') as f:
+        rest = ""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk: break
+            lines = (rest + chunk).split("\n")
+            rest = lines.pop()
+            for line in lines:
+                yield line
+        if rest:
+            yield rest
+
 def read_csv(filename):
     with open(filename,'r') as f:
         lines = f.readlines()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import math
+from bisect import bisect_right
 from decimal import Decimal
 from .obdd import ObddManager, ObddNode
 from .timer import Timer
@@ -15,6 +16,7 @@ class Classifier:
         self.weights = weights
         self.threshold = threshold
         self.is_integer = self.check_integrality()
+        self._weights = None # integer weights (see _int_weights)
         # extra stuff from Andy's format
         #self.num_values = num_values
         #self.prior = prior
@@ -115,6 +117,31 @@ class Classifier:
         assert c.is_integer
         return c
 
+    def _int_weights(self):
+        if self._weights is None:
+            assert self.is_integer
+            self._weights = [ int(weight) for weight in self.weights ]
+            self._threshold = int(self.threshold)
+        return self._weights,self._threshold
+
+    def evaluate(self,inst):
+        """evaluates the (integer) neuron directly, by a weighted sum.
+        inst is a map: var_index -> {0,1}"""
+        weights,threshold = self._int_weights()
+        total = 0
+        for var,weight in enumerate(weights,1):
+            if inst[var]: total += weight
+        return 1 if total >= threshold else 0
+
+    def evaluate_batch(self,X):
+        """evaluates the (integer) neuron on each row of X, an (N x size)
+        0/1 matrix, by a matrix-vector product.  returns an N-vector"""
+        import numpy as np
+        weights,threshold = self._int_weights()
+        weights = np.array(weights,dtype=np.int64)
+        totals = np.asarray(X,dtype=np.int64) @ weights
+        return (totals >= threshold).astype(np.uint8)
+
     def _get_bounds(self):
         assert self.is_integer
         lower,upper = 0,0
@@ -126,29 +153,124 @@ class Classifier:
                 upper += weight
         return (lower,upper)
 
-    def _to_obdd(self,matrix):
+    def _to_obdd(self,matrix,order):
         var_count = int(self.size)
-        manager = ObddManager(var_count)
+        manager = ObddManager(var_count,var_order=order)
         one,zero = manager.one_sink(),manager.zero_sink()
         last_level = matrix[var_count+1]
         for node in last_level:
             last_level[node] = one if last_level[node] else zero
-        for dvar in range(var_count,0,-1):
-            level,next_level = matrix[dvar],matrix[dvar+1]
+        for i in range(var_count,0,-1):
+            dvar = order[i-1]
+            level,next_level = matrix[i],matrix[i+1]
             for node in level:
                 hi,lo = level[node] # get indices
                 hi,lo = next_level[hi],next_level[lo] # get nodes
                 level[node] = manager.new_node(dvar,hi,lo)
         return (manager,matrix[1][0])
 
-    def compile(self):
+    def _order(self,order):
+        """returns order as a list of variables, top to bottom.  order is
+        None (the order 1..n), a list of variables, or the name of an
+        ordering heuristic (see circuits.ordering)"""
+        var_count = int(self.size)
+        if order is None:
+            return list(range(1,var_count+1))
+        if isinstance(order,str):
+            from .ordering import get_order
+            return get_order(self,order)
+        return list(order)
+
+    def compile(self,order=None):
+        """compiles the (integer) neuron into an OBDD, testing variables
+        in the given order (see _order), by default 1..n.
+
+        The sub-function reached after testing variables 1..i-1 depends
+        only on the partial sum s of their weights, and each node at
+        level i is the sub-function of an interval [a,b] of partial sums
+        (see Chan & Darwiche, "Reasoning about Bayesian network
+        classifiers", 2003, and Behle, "On threshold BDDs", 2007).  We
+        keep these intervals per level, so a partial sum falling in a
+        known interval reuses its node, and equivalent nodes are never
+        created.  Sub-functions that are constant are detected from the
+        minimum and maximum sums reachable from the remaining weights.
+        The resulting OBDD is reduced."""
+        return self._compile(self._order(order))
+
+    def _compile(self,order,node_limit=None):
+        """compiles with variable order (a list), as in compile.  if more
+        than node_limit decision nodes are needed, gives up and returns
+        (manager,None)"""
+        assert self.is_integer
+        var_count = int(self.size)
+        weights = [None] + [ int(self.weights[var-1]) for var in order ]
+        threshold = int(self.threshold)
+        manager = ObddManager(var_count,var_order=order)
+        inf = float('inf')
+        if node_limit is None: node_limit = inf
+        one,zero = manager.one_sink(),manager.zero_sink()
+
+        # true_at[i]: least partial sum s where level i is constant true
+        # false_at[i]: greatest partial sum s where level i is constant false
+        true_at = [threshold]*(var_count+2)
+        false_at = [threshold-1]*(var_count+2)
+        for i in range(var_count,0,-1):
+            weight = weights[i]
+            true_at[i] = true_at[i+1] - min(weight,0)
+            false_at[i] = false_at[i+1] - max(weight,0)
+        # the intervals [starts[i][k],lasts[i][k]] of level i, sorted
+        starts = [ [] for _ in range(var_count+2) ]
+        lasts = [ [] for _ in range(var_count+2) ]
+        nodes = [ [] for _ in range(var_count+2) ]
+
+        results = []
+        stack = [(1,0)]
+        while stack:
+            i,s = stack.pop()
+            if i < 0: # children done
+                i = -i
+                lo,lo_first,lo_last = results.pop()
+                hi,hi_first,hi_last = results.pop()
+                weight = weights[i]
+                first = max(hi_first-weight,lo_first)
+                last = min(hi_last-weight,lo_last)
+                if hi is lo:
+                    node = hi
+                else:
+                    node = manager.new_node(order[i-1],hi,lo)
+                    if manager.id_counter-2 > node_limit:
+                        return (manager,None)
+                k = bisect_right(starts[i],first)
+                starts[i].insert(k,first)
+                lasts[i].insert(k,last)
+                nodes[i].insert(k,node)
+                results.append((node,first,last))
+            elif s >= true_at[i]:
+                results.append((one,true_at[i],inf))
+            elif s <= false_at[i]:
+                results.append((zero,-inf,false_at[i]))
+            else:
+                k = bisect_right(starts[i],s)-1
+                if k >= 0 and s <= lasts[i][k]:
+                    results.append((nodes[i][k],starts[i][k],lasts[i][k]))
+                else:
+                    stack.append((-i,s))
+                    stack.append((i+1,s)) # lo
+                    stack.append((i+1,s+weights[i])) # hi
+        return (manager,results[0][0])
+
+    def compile_by_levels(self,order=None):
+        """compiles the (integer) neuron into an OBDD, with one node per
+        distinct partial sum at each level (see compile).  the OBDD is
+        not reduced"""
         assert self.is_integer
         var_count = int(self.size)
+        order = self._order(order)
         matrix = [ dict() for _ in range(var_count+2) ]
         matrix[1][0] = None # root node
         for i in range(1,var_count+1):
             level,next_level = matrix[i],matrix[i+1]
-            weight = int(self.weights[i-1])
+            weight = int(self.weights[order[i-1]-1])
             for node in level:
                 hi,lo = (node+weight,node)
                 level[node] = (hi,lo) # (hi,lo)
@@ -158,7 +280,7 @@ class Classifier:
         threshold = int(self.threshold)
         for node in last_level:
             last_level[node] = node >= threshold
-        return self._to_obdd(matrix)
+        return self._to_obdd(matrix,order)
 
 if __name__ == '__main__':
     precision = 2
@@ -187,12 +309,12 @@ if __name__ == '__main__':
     obdd_manager.save_vtree("tmp.vtree")
     obdd_manager.save_sdd("tmp.sdd",node)
 
-    with Timer("to sdd"):
+    with Timer("to sdd (apply)"):
         offset = int(c.offset)
-        sdd_manager,sdd_node = obdd_manager.obdd_to_sdd(node,offset=offset)
-    with Timer("read sdd"):
-        sdd_filename = b'tmp.sdd'
-        alpha = sdd_manager.read_sdd_file(sdd_filename)
+        sdd_manager,sdd_node = obdd_manager.obdd_to_sdd(node,offset=offset,
+                                                        bulk=False)
+    with Timer("to sdd (bulk)"):
+        sdd_manager,alpha = obdd_manager.obdd_to_sdd(node,offset=offset)
 
     print("sdd nodes/size: %d/%d" % (sdd_node.count(),sdd_node.size()))
     print("sdd nodes/size: %d/%d" % (alpha.count(),alpha.size()))
@@ -1,20 +1,44 @@
 #!/usr/bin/env python3
 
 import sys
-from random import randint
 from circuits import *
 from circuits.data import read_csv
+from circuits.simulate import random_words, popcount
+from circuits.cache import default_cache
+from circuits.vtree import get_vtree
 
 def compile_nn(nnf_filename,precision,dataset_filename,\
                sdd_filename="tmp.sdd",vtree_filename="tmp.vtree",\
-               var_order=None,verbose=False):
+               var_order=None,ordering=None,workers=None,verbose=False,
+               profiler=None,vtree_type="right",combine="linear"):
+    """compiles a neural network into an SDD.  the vtree is of
+    vtree_type: a PySDD vtree type over var_order (by default 1..n), or
+    "minfill" or "bisection" for a vtree derived from the flattened
+    circuit (see circuits.vtree).  the children of each gate are
+    combined by the policy combine (see compile_nnf).  each stage
+    (reading, flattening, compiling, minimizing, ...) is recorded as a
+    stage of profiler (a circuits.timer.Profiler), or of the default
+    profiler"""
+    from circuits.timer import default_profiler
+    if profiler is None: profiler = default_profiler
+    with profiler:
+        _compile_nn(nnf_filename,precision,dataset_filename,
+                    sdd_filename,vtree_filename,
+                    var_order,ordering,workers,verbose,vtree_type,combine)
+
+def _compile_nn(nnf_filename,precision,dataset_filename,
+                sdd_filename,vtree_filename,
+                var_order,ordering,workers,verbose,vtree_type,combine):
     from circuits import Timer # ACAC???
     from pysdd.sdd import Vtree, SddManager, SddNode
+    import numpy as np
 
     with Timer("reading"):
         manager,nnf = Nnf.read(nnf_filename)
     with Timer("flattening"):
-        flat = nnf.flatten(manager,precision=precision)
+        flat = nnf.flatten(manager,precision=precision,ordering=ordering,
+                           workers=workers)
+    print("neuron cache: %s" % default_cache)
     # flat is an NNF (and/or circuit)
     var_count = manager.var_count
     node_count,edge_count = flat.root.count_and_size()
@@ -22,31 +46,25 @@ def compile_nn(nnf_filename,precision,dataset_filename,\
     print("%d edge count" % edge_count)
 
     # the following block can be skipped
-    count = 0
-    true_count = 0
-    total = 100
+    total = 2**16
     with Timer("sanity checking"):
-        for _ in range(total):
-            inst = [ randint(0,1) for _ in range(var_count+1) ]
-            one = nnf.is_model(inst)
-            two = flat.is_model(inst)
-            count += int(one == two)
-            if one: true_count += 1
+        words = random_words(var_count,total)
+        one = nnf.simulate(words,total)
+        two = flat.simulate(words,total)
+        count = total - popcount(one ^ two)
+        true_count = popcount(one)
     print("%d/%d correct" % (count,total))
     print("%d/%d positive" % (true_count,total))
 
+    with Timer("making vtree (%s)" % vtree_type):
+        vtree = get_vtree(flat,vtree_type,var_order)
     with Timer("compiling"):
-        if var_order is None:
-            vtree = Vtree(var_count=manager.var_count,vtree_type="right")
-            sdd_manager = SddManager(vtree=vtree)
-        else:
-            vtree = Vtree.new_with_var_order(manager.var_count,\
-                                             var_order,"right")
-            sdd_manager = SddManager(vtree=vtree)
+        sdd_manager = SddManager(vtree=vtree)
         # ACACAC
         #alpha = compile_nnf_manual(flat,sdd_manager,verbose=verbose)
         #alpha = compile_nnf_recursive(flat,sdd_manager,verbose=verbose)
-        alpha = compile_nnf_recursive_by_depth(flat,sdd_manager,verbose=verbose)
+        alpha = compile_nnf_recursive_by_depth(flat,sdd_manager,verbose=verbose,
+                                               combine=combine)
     print("%d node count" % alpha.count())
     print("%d edge count" % alpha.size())
 
@@ -60,15 +78,12 @@ def compile_nn(nnf_filename,precision,dataset_filename,\
 
 
     if dataset_filename:
-        dataset = read_csv(dataset_filename)
-        correct = 0
+        dataset = np.array(read_csv(dataset_filename))
         N = len(dataset)
         with Timer("evaluating test set accuracy"):
-            for example in dataset:
-                inst = [0]+example[:-1]
-                label = example[-1]
-                prediction = flat.is_model(inst)
-                correct += int(label == prediction)
+            insts,labels = dataset[:,:-1],dataset[:,-1]
+            predictions = flat.is_model_batch(insts)
+            correct = int((labels == predictions).sum())
         print("test accuracy: %d/%d = %.4f" % (correct,N,correct/N))
 
     with Timer("saving"):
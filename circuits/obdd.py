@@ -1,15 +1,49 @@
+import os
+import tempfile
+import time
+from itertools import count
+
+# traversal stamps (see ObddNode.__iter__)
+_epochs = count(1)
+
+# operations of the apply engine (see ObddManager._apply)
+_AND,_OR,_NOT,_ITE = 0,1,2,3
+
 class ObddManager:
-    def __init__(self,var_count,use_cache=True): # ACACAC: use_cache
+    def __init__(self,var_count,use_cache=True,var_order=None,
+                 computed_table_size=2**18): # ACACAC: use_cache
         self.var_count = var_count
-        #self.ordering = ordering # ACAC
+        # var_order[i]: the variable tested at level i+1 (top to bottom)
+        # var_position[var]: the level (1..n) of variable var
+        if var_order is None:
+            var_order = list(range(1,var_count+1))
+        assert sorted(var_order) == list(range(1,var_count+1))
+        self.var_order = list(var_order)
+        # terminals (dvar 0) are below all levels
+        self.var_position = [var_count+1]*(var_count+1)
+        for position,var in enumerate(self.var_order,1):
+            self.var_position[var] = position
         self.zero = ObddNode(is_terminal=True,sign=0,nid=0)
         self.one = ObddNode(is_terminal=True,sign=1,nid=1)
+        self.zero.manager = self.one.manager = self
         self.id_counter = 2
         # unique node cache (possibly external)
         self.use_cache = use_cache
         self.cache = [ {} for _ in range(var_count+1) ]
         self.cache_hits = 0
         self.cache_misses = 0
+        self.node_count = 0 # number of nodes in the unique table
+        # computed table of the apply engine, a direct-mapped (lossy)
+        # cache of computed_table_size entries, allocated on first use
+        self.computed_table_size = computed_table_size
+        self.computed_table = None
+        self.computed_hits = 0
+        self.computed_misses = 0
+        # dynamic variable reordering (see auto_reorder_on)
+        self.auto_reorder = False
+        self.reorder_threshold = None
+        self.reorder_count = 0
+        self.reorder_time = 0.0
         # stats for oracle
         self.sat_calls = 0
         self.sat_time = 0.0
@@ -45,11 +79,26 @@ class ObddManager:
         # me is output wire
         return Cnf(me,clauses),me
 
-    def obdd_to_sdd(self,root,offset=0):
+    def obdd_to_sdd(self,root,offset=0,bulk=True):
+        """converts the OBDD root to an SDD, for a right-linear vtree over
+        var_count+offset variables, where OBDD variable i is SDD variable
+        i+offset (variables 1..offset are placed first).  returns
+        (sdd_manager,sdd_node).
+
+        With bulk, the SDD is written directly from the OBDD (see
+        save_sdd) and read by PySDD, in time linear in the OBDD.
+        Otherwise, it is built by an SDD apply per OBDD node."""
         from pysdd.sdd import Vtree, SddManager
         var_count = self.var_count + offset
-        vtree = Vtree(var_count=var_count,vtree_type="right")
+        var_order = self._vtree_order(offset)
+        vtree = Vtree.new_with_var_order(var_count,var_order,"right")
         mgr = SddManager.from_vtree(vtree)
+        if root.is_terminal():
+            alpha = mgr.true() if root.is_true() else mgr.false()
+            return (mgr,alpha)
+        if bulk:
+            alpha = read_sdd_text(mgr,self.sdd_text(root,offset=offset))
+            return (mgr,alpha)
         for node in root.__iter__(clear_data=True):
             if node.is_terminal():
                 alpha = mgr.true() if node.is_true() else mgr.false()
@@ -112,9 +161,11 @@ class ObddManager:
             if key in self.cache[dvar]:
                 return self.cache[dvar][key]
         node = ObddNode(dvar=dvar,hi=hi,lo=lo,nid=self.id_counter)
+        node.manager = self
         self.id_counter += 1
         if self.use_cache:
             self.cache[dvar][key] = node
+            self.node_count += 1
         """
         if self.id_counter % 1000 == 0:
             print(self.id_counter)
@@ -122,15 +173,378 @@ class ObddManager:
         """
         return node
 
-    def save_vtree(self,filename):
+    def true(self):
+        return self.one
+
+    def false(self):
+        return self.zero
+
+    def literal(self,lit):
+        var = abs(lit)
+        if lit > 0:
+            return self.new_node(var,self.one,self.zero)
+        else:
+            return self.new_node(var,self.zero,self.one)
+
+    def conjoin(self,f,g):
+        if self.auto_reorder: self._check_reorder((f,g))
+        return self._apply(_AND,(f,g))
+
+    def disjoin(self,f,g):
+        if self.auto_reorder: self._check_reorder((f,g))
+        return self._apply(_OR,(f,g))
+
+    def negate(self,f):
+        if self.auto_reorder: self._check_reorder((f,))
+        return self._apply(_NOT,(f,))
+
+    def ite(self,f,g,h):
+        """if f then g else h"""
+        if self.auto_reorder: self._check_reorder((f,g,h))
+        return self._apply(_ITE,(f,g,h))
+
+    def restrict(self,f,lits):
+        """conditions f on a literal, or a list of literals"""
+        if isinstance(lits,int): lits = [lits]
+        values = { abs(lit): lit > 0 for lit in lits }
+        for node in f.__iter__(clear_data=True):
+            if node.is_terminal():
+                alpha = node
+            elif node.dvar in values:
+                alpha = node.hi.data if values[node.dvar] else node.lo.data
+            else:
+                hi,lo = node.hi.data,node.lo.data
+                alpha = hi if hi is lo else self.new_node(node.dvar,hi,lo)
+            node.data = alpha
+        return alpha
+
+    def exists(self,f,variables):
+        """existentially quantifies a variable, or a list of variables,
+        out of f"""
+        if isinstance(variables,int): variables = [variables]
+        variables = set(variables)
+        for node in f.__iter__(clear_data=True):
+            if node.is_terminal():
+                alpha = node
+            else:
+                hi,lo = node.hi.data,node.lo.data
+                if node.dvar in variables:
+                    alpha = self._apply(_OR,(hi,lo))
+                else:
+                    alpha = hi if hi is lo else self.new_node(node.dvar,hi,lo)
+            node.data = alpha
+        return alpha
+
+    def reduce(self,root):
+        """reduces the OBDD root, returning (root,merged_count).
+
+        Nodes are visited bottom-up, level by level.  A node whose
+        (reduced) children are equal is replaced by its child, and a node
+        whose children match an existing entry of the unique table
+        (self.cache) is replaced by that entry.  The remaining nodes are
+        updated in place, and are (re-)entered in the unique table.  The
+        result is the unique reduced OBDD of root, for the manager's
+        variable order.  merged_count is the number of decision nodes
+        that were replaced.  Linear time in the size of root."""
+        if root.is_terminal(): return (root,0)
+        position = self.var_position
+        levels = [ [] for _ in range(self.var_count+1) ]
+        for node in root:
+            if node.is_decision():
+                levels[position[node.dvar]].append(node)
+        merged = [] # node.data is the replacement of a merged node
+        for level in reversed(levels):
+            for node in level:
+                hi,lo = node.hi,node.lo
+                if hi.data is not None: hi = hi.data
+                if lo.data is not None: lo = lo.data
+                table = self.cache[node.dvar]
+                old_key = (node.hi.nid,node.lo.nid)
+                if table.get(old_key) is node:
+                    del table[old_key]
+                    self.node_count -= 1
+                if hi is lo:
+                    node.data = hi
+                    merged.append(node)
+                    continue
+                key = (hi.nid,lo.nid)
+                if key in table:
+                    node.data = table[key]
+                    merged.append(node)
+                else:
+                    node.hi,node.lo = hi,lo
+                    table[key] = node
+                    self.node_count += 1
+        new_root = root if root.data is None else root.data
+        for node in merged:
+            node.data = None
+        return (new_root,len(merged))
+
+    def clear_computed_table(self):
+        self.computed_table = None
+
+    ########################################
+    # dynamic variable reordering
+    ########################################
+
+    def auto_reorder_on(self,threshold=2**14,growth=2.0,**limits):
+        """sift (see sift) whenever the unique table grows past threshold
+        nodes, at the start of conjoin/disjoin/negate/ite.  the threshold
+        is then raised to growth times the size after sifting.  limits
+        are passed on to sift.
+
+        As with SddManager.auto_gc_and_minimize_on, nodes that are still
+        needed must be protected with ObddNode.ref(): other nodes may be
+        removed from the unique table, and are no longer valid."""
+        self.auto_reorder = True
+        self.reorder_threshold = threshold
+        self._reorder_growth = growth
+        self._reorder_limits = limits
+
+    def auto_reorder_off(self):
+        self.auto_reorder = False
+
+    # so that compile_nnf_automatic also runs on an ObddManager
+    auto_gc_and_minimize_on = auto_reorder_on
+    auto_gc_and_minimize_off = auto_reorder_off
+
+    def _check_reorder(self,args):
+        if self.node_count < self.reorder_threshold: return
+        size = self.sift(roots=args,**self._reorder_limits)
+        self.reorder_threshold = max(self.reorder_threshold,
+                                     int(self._reorder_growth*size))
+
+    def sift(self,roots=None,max_growth=1.2,time_limit=None,size_limit=None):
+        """reorders variables in place by sifting (Rudell, "Dynamic
+        variable ordering for ordered binary decision diagrams", 1993),
+        returns the new size (number of nodes in the unique table).
+
+        Each variable, largest level first, is moved to every level by
+        swapping adjacent levels, and then back to the level where the
+        OBDD was smallest.  A variable stops moving in one direction once
+        the size grows past max_growth times the best size seen, or past
+        size_limit.  Sifting stops after time_limit seconds.
+
+        The nodes kept are those reachable from the list roots, and from
+        the nodes protected by ObddNode.ref().  Every other node is
+        removed from the unique table, and is no longer valid.  Kept
+        nodes are modified in place, and still represent the same
+        function.  The computed table is cleared."""
+        assert self.use_cache
+        start = time.time()
+        deadline = None if time_limit is None else start + time_limit
+        if size_limit is None: size_limit = float('inf')
+        self._prepare_reorder(roots)
+        variables = list(range(1,self.var_count+1))
+        variables.sort(key=lambda var: len(self.cache[var]),reverse=True)
+        for var in variables:
+            if deadline is not None and time.time() > deadline: break
+            self._sift_variable(var,max_growth,size_limit,deadline)
+        self._finish_reorder()
+        self.reorder_count += 1
+        self.reorder_time += time.time()-start
+        return self.node_count
+
+    def swap(self,i,roots=None):
+        """swaps the variables at levels i and i+1 (see sift)"""
+        assert self.use_cache and 1 <= i < self.var_count
+        self._prepare_reorder(roots)
+        self._swap(i)
+        self._finish_reorder()
+        return self.node_count
+
+    def _prepare_reorder(self,roots):
+        """keeps only the nodes reachable from roots (and from referenced
+        nodes) in the unique table, and counts their references"""
+        roots = [] if roots is None else list(roots)
+        for table in self.cache:
+            roots.extend( node for node in table.values() if node._ext_refs )
+        epoch = next(_epochs)
+        live = []
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            if node.is_terminal() or node._mark == epoch: continue
+            node._mark = epoch
+            node._ref_count = node._ext_refs
+            live.append(node)
+            stack.append(node.hi)
+            stack.append(node.lo)
+        self.cache = [ {} for _ in range(self.var_count+1) ]
+        for node in live:
+            self.cache[node.dvar][(node.hi.nid,node.lo.nid)] = node
+            node.hi._ref_count += 1
+            node.lo._ref_count += 1
+        for node in roots:
+            node._ref_count += 1
+        self.node_count = len(live)
+        self.clear_computed_table()
+
+    def _finish_reorder(self):
+        self.clear_computed_table()
+        self.one._ref_count = self.zero._ref_count = 0
+
+    def _sift_variable(self,var,max_growth,size_limit,deadline):
+        """moves var to its best level (see sift)"""
+        n = self.var_count
+        position = self.var_position[var]
+        best_size,best_position = self.node_count,position
+        # visit the nearest end first
+        ends = (n,1) if n-position < position-1 else (1,n)
+        for end in ends:
+            while position != end:
+                if position < end:
+                    self._swap(position)
+                    position += 1
+                else:
+                    self._swap(position-1)
+                    position -= 1
+                size = self.node_count
+                if size < best_size:
+                    best_size,best_position = size,position
+                if size > max_growth*best_size or size > size_limit: break
+                if deadline is not None and time.time() > deadline: break
+        while position < best_position:
+            self._swap(position)
+            position += 1
+        while position > best_position:
+            self._swap(position-1)
+            position -= 1
+
+    def _swap(self,i):
+        """swaps the variables x and y at levels i and i+1, in place.  a
+        node of x that depends on y becomes a node of y, with new
+        children of x.  other nodes of x and y keep their variables"""
+        x,y = self.var_order[i-1],self.var_order[i]
+        x_table,y_table = self.cache[x],self.cache[y]
+        moved = [ node for node in x_table.values()
+                  if node.hi.dvar == y or node.lo.dvar == y ]
+        for node in moved:
+            del x_table[(node.hi.nid,node.lo.nid)]
+        for node in moved:
+            f1,f0 = node.hi,node.lo
+            f11,f10 = (f1.hi,f1.lo) if f1.dvar == y else (f1,f1)
+            f01,f00 = (f0.hi,f0.lo) if f0.dvar == y else (f0,f0)
+            hi = self._swap_node(x,f11,f01)
+            lo = self._swap_node(x,f10,f00)
+            hi._ref_count += 1
+            lo._ref_count += 1
+            node.dvar,node.hi,node.lo = y,hi,lo
+            y_table[(hi.nid,lo.nid)] = node
+            self._deref_node(f1)
+            self._deref_node(f0)
+        self.var_order[i-1],self.var_order[i] = y,x
+        self.var_position[y],self.var_position[x] = i,i+1
+
+    def _swap_node(self,dvar,hi,lo):
+        """new_node, counting references to a new node's children"""
+        if hi is lo: return hi
+        count = self.id_counter
+        node = self.new_node(dvar,hi,lo)
+        if self.id_counter > count:
+            node._ref_count = 0
+            hi._ref_count += 1
+            lo._ref_count += 1
+        return node
+
+    def _deref_node(self,node):
+        """drops a reference to node, removing it (and then its
+        descendants) from the unique table when it has no references"""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.is_terminal(): continue
+            node._ref_count -= 1
+            if node._ref_count == 0:
+                del self.cache[node.dvar][(node.hi.nid,node.lo.nid)]
+                self.node_count -= 1
+                stack.append(node.hi)
+                stack.append(node.lo)
+
+    def _terminal_case(self,op,args):
+        """returns the result of op on args, if it is immediate, and
+        otherwise None"""
+        one,zero = self.one,self.zero
+        if op == _AND:
+            f,g = args
+            if f is zero or g is zero: return zero
+            if f is one: return g
+            if g is one or f is g: return f
+        elif op == _OR:
+            f,g = args
+            if f is one or g is one: return one
+            if f is zero: return g
+            if g is zero or f is g: return f
+        elif op == _NOT:
+            f, = args
+            if f is one: return zero
+            if f is zero: return one
+        elif op == _ITE:
+            f,g,h = args
+            if f is one: return g
+            if f is zero: return h
+            if g is h: return g
+            if g is one and h is zero: return f
+        return None
+
+    def _apply(self,op,args):
+        """applies op to the OBDDs args, by Shannon expansion on the
+        topmost variable of args (Bryant, 1986).  sub-results are kept in
+        the computed table.  iterative, with an explicit stack"""
+        if self.computed_table is None:
+            self.computed_table = [None]*self.computed_table_size
+        table,mask = self.computed_table,self.computed_table_size-1
+        position = self.var_position
+        results = []
+        stack = [(args,None,0)]
+        while stack:
+            args,key,dvar = stack.pop()
+            if dvar: # cofactors done
+                lo,hi = results.pop(),results.pop()
+                node = hi if hi is lo else self.new_node(dvar,hi,lo)
+                table[hash(key) & mask] = (key,node)
+                results.append(node)
+                continue
+            if op <= _OR and args[0].nid > args[1].nid: # commutative
+                args = (args[1],args[0])
+            node = self._terminal_case(op,args)
+            if node is not None:
+                results.append(node)
+                continue
+            key = (op,) + tuple( arg.nid for arg in args )
+            entry = table[hash(key) & mask]
+            if entry is not None and entry[0] == key:
+                self.computed_hits += 1
+                results.append(entry[1])
+                continue
+            self.computed_misses += 1
+            dvar = min(( arg.dvar for arg in args ),key=position.__getitem__)
+            his = tuple( arg.hi if arg.dvar == dvar else arg for arg in args )
+            los = tuple( arg.lo if arg.dvar == dvar else arg for arg in args )
+            stack.append((args,key,dvar))
+            stack.append((los,None,0))
+            stack.append((his,None,0))
+        return results[0]
+
+    def _vtree_order(self,offset=0):
+        """the left-to-right variables of the right-linear vtree of the
+        manager's order, where variables are shifted by offset, and
+        variables 1..offset are placed first"""
+        var_order = list(range(1,offset+1))
+        var_order += [ var + offset for var in self.var_order ]
+        return var_order
+
+    def save_vtree(self,filename,offset=0):
+        var_order = self._vtree_order(offset)
+        var_count = len(var_order)
         with open(filename,'w') as f:
-            n = 2*self.var_count - 1
+            n = 2*var_count - 1
             f.write("vtree %d\n" % n)
-            for i in range(self.var_count):
-                var = i + 1
+            for i,var in enumerate(var_order):
                 vtree_id = 2*i
                 f.write("L %d %d\n" % (vtree_id,var))
-            last_vtree_id = 2*(self.var_count-1)-1
+            if var_count == 1: return
+            last_vtree_id = 2*(var_count-1)-1
             left_id,right_id = last_vtree_id-1,last_vtree_id+1
             f.write("I %d %d %d\n" % (last_vtree_id,left_id,right_id))
             for vtree_id in range(last_vtree_id-2,0,-2):
@@ -138,58 +552,95 @@ class ObddManager:
                 right_id = vtree_id + 2
                 f.write("I %d %d %d\n" % (vtree_id,left_id,right_id))
 
-    def save_sdd(self,filename,root):
-        last_var = self.var_count
-        count,last_count = root.count(dvar=last_var)
-        terminal_count = root.count_terminals()
-        # decision-nodes + terminals + literals - last-decision-nodes
-        node_count = (count + terminal_count + 2*self.var_count) - last_count
-        cache = {}
-        with open(filename,'w') as f:
-            f.write("sdd %d\n" % node_count)
-            node_id = 0
-            # literal-ids range from 0 to 2*n-1
-            for var in range(1,self.var_count+1):
-                vtree_id = 2*(var-1)
-                f.write("L %d %d %d\n" % (node_id,vtree_id,-var))
-                node_id += 1
-                f.write("L %d %d %d\n" % (node_id,vtree_id,var))
-                node_id += 1
-            for node in root:
-                if node.is_terminal():
-                    if node.is_false():
-                        label = "F"
-                        false_id = node_id
-                    else:
-                        label = "T"
-                        true_id = node_id
-                    f.write("%s %d\n" % (label,node_id))
-                    new_node_id = node_id
-                    node_id += 1
+    def _sdd_lines(self,root,offset=0):
+        """returns the node lines of the .sdd file of root, for the vtree
+        of save_vtree.  Each decision node becomes a decision node with
+        elements (x,hi) and (-x,lo), except where (hi,lo) is (T,F) or
+        (F,T), when it becomes a literal (the SDD is trimmed).  The root
+        is the last line."""
+        position = self.var_position
+        lines = []
+        # literal-ids range from 0 to 2*n-1 (negative literal first)
+        for i,var in enumerate(self.var_order):
+            vtree_id = 2*(i+offset)
+            lines.append("L %d %d %d" % (2*i,vtree_id,-(var+offset)))
+            lines.append("L %d %d %d" % (2*i+1,vtree_id,var+offset))
+        ids = {}
+        for node in root:
+            if node.is_terminal():
+                label = "T" if node.is_true() else "F"
+                new_id = len(lines)
+                lines.append("%s %d" % (label,new_id))
+            else:
+                hi,lo = node.hi,node.lo
+                i = position[node.dvar]-1
+                neg_id,pos_id = 2*i,2*i+1
+                if hi is lo:
+                    new_id = ids[hi.nid]
+                elif hi.is_true() and lo.is_false():
+                    new_id = pos_id
+                elif hi.is_false() and lo.is_true():
+                    new_id = neg_id
                 else:
-                    var = node.dvar
-                    neg_id,pos_id = 2*(var-1),2*(var-1)+1
-                    if var == last_var:
-                        if node.hi.is_true() and node.lo.is_true():
-                            new_node_id = true_id
-                        elif node.hi.is_false() and node.lo.is_false():
-                            new_node_id = false_id
-                        elif node.hi.is_true() and node.lo.is_false():
-                            new_node_id = pos_id
-                        elif node.hi.is_false() and node.lo.is_true():
-                            new_node_id = neg_id
-                    else:
-                        vtree_id = 2*(var-1) + 1
-                        hi_id = cache[node.hi.nid]
-                        lo_id = cache[node.lo.nid]
-                        f.write("D %d %d 2 %d %d %d %d\n" % \
-                                (node_id,vtree_id,pos_id,hi_id,neg_id,lo_id))
-                        new_node_id = node_id
-                        node_id += 1
-                cache[node.nid] = new_node_id
+                    vtree_id = 2*(i+offset) + 1
+                    hi_id,lo_id = ids[hi.nid],ids[lo.nid]
+                    new_id = len(lines)
+                    lines.append("D %d %d 2 %d %d %d %d" % \
+                                 (new_id,vtree_id,pos_id,hi_id,neg_id,lo_id))
+            ids[node.nid] = new_id
+        root_id = ids[root.nid]
+        if root_id != len(lines)-1: # repeat the root, as the last line
+            line = lines[root_id].split(" ")
+            line[1] = str(len(lines))
+            lines.append(" ".join(line))
+        return lines
+
+    def save_sdd(self,filename,root,offset=0):
+        lines = self._sdd_lines(root,offset=offset)
+        with open(filename,'w') as f:
+            f.write("sdd %d\n" % len(lines))
+            for line in lines:
+                f.write(line)
+                f.write("\n")
+
+    def sdd_text(self,root,offset=0):
+        """returns the .sdd file of root (see save_sdd), as a string"""
+        lines = self._sdd_lines(root,offset=offset)
+        return "sdd %d\n%s\n" % (len(lines),"\n".join(lines))
+
+
+def read_text(text,read,suffix=""):
+    """returns read(filename), for a file holding text.  PySDD only reads
+    from files, so the text is passed through an in-memory file
+    (memfd_create) where available, and through a temporary file
+    otherwise"""
+    data = text.encode()
+    if hasattr(os,"memfd_create") and os.path.isdir("/proc/self/fd"):
+        fd = os.memfd_create("pysdd")
+        try:
+            with os.fdopen(fd,'wb',closefd=False) as f:
+                f.write(data)
+            return read(b"/proc/self/fd/%d" % fd)
+        finally:
+            os.close(fd)
+    with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+        f.write(data)
+        f.flush()
+        return read(f.name.encode())
+
+def read_sdd_text(mgr,text):
+    """reads an SDD, given as the text of an .sdd file, into the PySDD
+    SddManager mgr (see read_text)"""
+    return read_text(text,mgr.read_sdd_file,suffix=".sdd")
 
 
 class ObddNode:
+    # fixed attribute layout: no per-node __dict__.  _parent and _index
+    # are scratch space for __iter__ and ObddManager._reindex
+    __slots__ = ("nid","context","sign","dvar","hi","lo","is_decision_node",
+                 "_mark","data","manager","_ext_refs","_ref_count",
+                 "_parent","_index")
+
     def __init__(self,dvar=None,hi=None,lo=None,
                  is_terminal=False,sign=False,nid=-1):
         self.nid = nid
@@ -207,46 +658,60 @@ class ObddNode:
             self.hi = hi
             self.lo = lo
             self.is_decision_node = True
-        self._bit = False
+        self._mark = 0 # epoch of last traversal that visited this node
         self.data = None
+        self.manager = None # set by ObddManager
+        self._ext_refs = 0 # see ref/deref
+        self._ref_count = 0 # used by ObddManager.sift
+        self._parent = None
+        self._index = None
+
+    def __and__(self,other):
+        return self.manager.conjoin(self,other)
+
+    def __or__(self,other):
+        return self.manager.disjoin(self,other)
+
+    def __invert__(self):
+        return self.manager.negate(self)
 
-    def __iter__(self,marker=True,clear_data=False,clear_bits=True):
+    def ref(self):
+        """protects the node from dynamic variable reordering (see
+        ObddManager.sift)"""
+        self._ext_refs += 1
+
+    def deref(self):
+        self._ext_refs -= 1
+
+    def __iter__(self,clear_data=False):
+        """post-order (children before parents) generator"""
+        epoch = next(_epochs)
+        visited = []
         cur,last = self,None
         self._parent = None
         while cur is not None:
-            if cur._bit is marker: # goto parent
+            if cur._mark == epoch: # goto parent
                 cur,last = cur._parent,cur
-                del last._parent
+                last._parent = None
             elif cur.is_terminal() or last == cur.lo: # goto parent
-                cur._bit = marker
+                cur._mark = epoch
+                if clear_data: visited.append(cur)
                 yield cur
                 cur,last = cur._parent,cur
-                del last._parent
+                last._parent = None
             elif last == cur.hi: # goto lo (check after lo)
                 cur.lo._parent = cur
                 cur,last = cur.lo,cur
             else: # goto hi
                 cur.hi._parent = cur
                 cur,last = cur.hi,cur
-        if clear_bits:
-            self.clear_bits(clear_data=clear_data)
-
-    def clear_bits(self,clear_data=False):
-        for node in self.__iter__(marker=False,clear_bits=False):
-            if clear_data: node.data = None
+        for node in visited:
+            node.data = None
 
     def reduce(self):
-        # TODO: do unique table lookup here? needed?
-        for node in self.__iter__(clear_data=True):
-            if node.is_terminal(): continue
-            if node.hi.data is not None:
-                node.hi = node.hi.data
-            if node.lo.data is not None:
-                node.lo = node.lo.data
-            if node.hi is node.lo:
-                node.data = node.hi
-            last = node.data
-        return self if last is None else last
+        """returns the reduced OBDD (see ObddManager.reduce)"""
+        root,_ = self.manager.reduce(self)
+        return root
 
     def model_count(self,var_count):
         if self.is_false(): return 0
@@ -259,6 +724,18 @@ class ObddNode:
                 node.data = count
         return count
 
+    def simulate(self,words,width):
+        """bit-parallel simulation (see Nnf.simulate)"""
+        mask = (1 << width)-1
+        for node in self.__iter__(clear_data=True):
+            if node.is_terminal():
+                word = mask if node.is_true() else 0
+            else:
+                x = words[node.dvar]
+                word = (x & node.hi.data) | (~x & node.lo.data & mask)
+            node.data = word
+        return word
+
     def models(self):
         """generator that yields all models of the obdd."""
         if self.is_terminal():
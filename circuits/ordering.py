@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""Variable orderings for compiling neurons to OBDDs.
+
+The size of a neuron's OBDD depends heavily on the order in which its
+variables are tested.  An ordering heuristic is a function that takes an
+(integer) Classifier and returns a list of its variables, top to bottom.
+Heuristics are registered by name in HEURISTICS, and a name can be
+passed wherever an order is expected, e.g., Classifier.compile(order=
+"best"), Nnf.flatten(mgr,ordering="weight") or compile_nn(...,
+ordering="best").
+"""
+
+from collections import defaultdict
+
+def input_order(c):
+    """the order 1..n"""
+    return list(range(1,int(c.size)+1))
+
+def weight_order(c):
+    """variables by descending weight magnitude (ties in input order)"""
+    weights = [ int(weight) for weight in c.weights ]
+    return sorted(range(1,len(weights)+1),key=lambda var: -abs(weights[var-1]))
+
+def grouped_order(c):
+    """variables with equal weights are tested consecutively, as a group.
+    since they are interchangeable, their partial sums take few distinct
+    values.  groups are ordered by descending size, and then by
+    descending weight magnitude"""
+    groups = defaultdict(list)
+    for var,weight in enumerate(c.weights,1):
+        groups[int(weight)].append(var)
+    key = lambda weight: (-len(groups[weight]),-abs(weight),weight)
+    return [ var for weight in sorted(groups,key=key) for var in groups[weight] ]
+
+def obdd_size(c,order,node_limit=None):
+    """the number of decision nodes in the OBDD of neuron c with the given
+    order, or None if there are more than node_limit"""
+    manager,root = c._compile(order,node_limit=node_limit)
+    if root is None: return None
+    return manager.id_counter-2
+
+def best_order(c,candidates=("input","weight","grouped")):
+    """compiles neuron c with the order of each candidate heuristic, and
+    returns the order giving the smallest OBDD.  each compilation gives up
+    once it is larger than the best so far, so this costs little more
+    than one compilation"""
+    best,best_size = None,None
+    for name in candidates:
+        order = HEURISTICS[name](c)
+        size = obdd_size(c,order,node_limit=best_size)
+        if size is not None and (best_size is None or size < best_size):
+            best,best_size = order,size
+    return best
+
+HEURISTICS = {
+    "input": input_order,
+    "weight": weight_order,
+    "grouped": grouped_order,
+    "best": best_order,
+}
+
+def get_order(c,name):
+    """returns the order of neuron c given by the named heuristic"""
+    if name not in HEURISTICS:
+        msg = "unknown ordering %s" % name
+        raise Exception("get_order: %s" % msg)
+    return HEURISTICS[name](c)
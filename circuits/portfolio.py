@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+"""Portfolio compilation of an NNF into an SDD.
+
+The size of the SDD, and the time to compile it, depend heavily on the
+vtree and on the compilation strategy (compile_nnf_*).  A portfolio runs
+several configurations at once, each in its own process with its own
+SddManager, and keeps either the first to finish, or the smallest SDD
+found within a deadline.  Other processes are then killed.
+
+A configuration is a dict with keys:
+    vtree_type: "right", "left", "vertical", "balanced" or "random", or
+                "minfill" or "bisection" (see circuits.vtree)
+    var_order:  a list of variables (left to right), or None for 1..n
+    strategy:   a key of STRATEGIES
+    combine:    optionally, a key of COMBINE_POLICIES (circuits.compiler)
+"""
+
+import os
+import sys
+import time
+import queue as queue_module
+import multiprocessing
+
+from .circuits import Nnf
+from .compiler import compile_nnf, compile_nnf_recursive, \
+    compile_nnf_recursive_by_depth, \
+    compile_nnf_automatic, compile_nnf_manual
+from .vtree import get_vtree
+
+STRATEGIES = {
+    "plain": compile_nnf,
+    "recursive": compile_nnf_recursive,
+    "recursive_by_depth": compile_nnf_recursive_by_depth,
+    "automatic": compile_nnf_automatic,
+    "manual": compile_nnf_manual,
+}
+
+def default_configs(var_count):
+    """a portfolio of vtree types and strategies, in the natural and the
+    reversed variable order"""
+    natural = None
+    reverse = list(range(var_count,0,-1))
+    configs = []
+    for var_order in (natural,reverse):
+        for vtree_type in ("right","balanced"):
+            for strategy in ("recursive_by_depth","automatic"):
+                configs.append({ "vtree_type": vtree_type,
+                                 "var_order": var_order,
+                                 "strategy": strategy })
+    return configs
+
+def config_name(index,config):
+    order = "natural" if config.get("var_order") is None else "order"
+    return "%d-%s-%s-%s" % (index,config["vtree_type"],order,
+                            config["strategy"])
+
+def _run_config(nnf_filename,config,name,dirname,results):
+    """compiles in a portfolio process, reporting to the queue results"""
+    from pysdd.sdd import SddManager
+    try:
+        start = time.time()
+        manager,nnf = Nnf.read(nnf_filename)
+        vtree = get_vtree(nnf,config["vtree_type"],config.get("var_order"))
+        mgr = SddManager.from_vtree(vtree)
+        combine = config.get("combine","linear")
+        alpha = STRATEGIES[config["strategy"]](nnf,mgr,combine=combine)
+        compile_time = time.time()-start
+        sdd_filename = os.path.join(dirname,name + ".sdd")
+        vtree_filename = os.path.join(dirname,name + ".vtree")
+        alpha.save(sdd_filename.encode())
+        mgr.vtree().save(vtree_filename.encode())
+        results.put({ "name": name, "status": "done",
+                      "time": compile_time,
+                      "size": alpha.size(), "count": alpha.count(),
+                      "sdd_filename": sdd_filename,
+                      "vtree_filename": vtree_filename })
+    except Exception as e:
+        results.put({ "name": name, "status": "failed", "error": repr(e) })
+
+def run_portfolio(nnf,configs=None,dirname="portfolio",deadline=None,
+                  mode="first",poll=0.1,verbose=True):
+    """compiles nnf (an Nnf, or an .nnf filename) with each configuration
+    of configs (by default, default_configs), in parallel processes.
+
+    With mode "first", the first configuration to finish is kept.  With
+    mode "smallest", the configuration with the smallest SDD is kept,
+    among those that finish within deadline seconds (all of them, if
+    deadline is None).  Remaining processes are killed.
+
+    Returns (best,results), where results has one dict per configuration
+    (its config, name, status, and wall-clock time; and if it finished,
+    its compile time, SDD size and count, and .sdd/.vtree filenames),
+    and best is the result that was kept (or None)."""
+    if mode not in ("first","smallest"):
+        raise Exception("run_portfolio: unknown mode %s" % mode)
+    os.makedirs(dirname,exist_ok=True)
+    if isinstance(nnf,Nnf):
+        nnf_filename = os.path.join(dirname,"input.nnf")
+        nnf.save(nnf_filename)
+    else:
+        nnf_filename = nnf
+    if configs is None:
+        with open(nnf_filename,'r') as f:
+            var_count = int(f.readline().split()[3])
+        configs = default_configs(var_count)
+
+    start = time.time()
+    context = multiprocessing.get_context()
+    results_queue = context.Queue()
+    results,processes = {},{}
+    for index,config in enumerate(configs):
+        name = config_name(index,config)
+        args = (nnf_filename,config,name,dirname,results_queue)
+        process = context.Process(target=_run_config,args=args,daemon=True)
+        process.start()
+        processes[name] = process
+        results[name] = { "name": name, "config": config,
+                          "status": "running" }
+
+    def record(result):
+        name = result["name"]
+        results[name].update(result)
+        results[name]["wall_time"] = time.time()-start
+        running.discard(name)
+        if verbose:
+            print("portfolio: %s %s (%.3fs)" % \
+                  (name,result["status"],results[name]["wall_time"]))
+
+    best = None
+    running = set(processes)
+    while running:
+        if deadline is not None and time.time()-start > deadline: break
+        try:
+            result = results_queue.get(timeout=poll)
+        except queue_module.Empty:
+            for name in list(running): # processes that died silently
+                exitcode = processes[name].exitcode
+                if exitcode is not None and exitcode != 0:
+                    results[name]["status"] = "failed"
+                    results[name]["error"] = "exit code %d" % exitcode
+                    results[name]["wall_time"] = time.time()-start
+                    running.discard(name)
+            continue
+        record(result)
+        if result["status"] != "done": continue
+        if best is None or result["size"] < best["size"]:
+            best = results[result["name"]]
+        if mode == "first": break
+
+    # results still in the queue keep their status (but are not kept)
+    while running:
+        try:
+            record(results_queue.get_nowait())
+        except queue_module.Empty:
+            break
+    status = "timeout" if running and deadline is not None and \
+             time.time()-start > deadline else "killed"
+    for name in running:
+        processes[name].terminate()
+        results[name]["status"] = status
+        results[name]["wall_time"] = time.time()-start
+    for process in processes.values():
+        process.join()
+    results_queue.close()
+    return best,[ results[config_name(i,c)] for i,c in enumerate(configs) ]
+
+if __name__ == '__main__':
+    if not ( 2 <= len(sys.argv) <= 4 ):
+        opts = "NNF-FILENAME [DEADLINE] [first|smallest]"
+        print( "usage: %s %s" % (sys.argv[0],opts) )
+        exit(1)
+
+    nnf_filename = sys.argv[1]
+    deadline = None if len(sys.argv) <= 2 else float(sys.argv[2])
+    mode = "first" if len(sys.argv) <= 3 else sys.argv[3]
+    best,results = run_portfolio(nnf_filename,deadline=deadline,mode=mode)
+    for result in results:
+        size = result.get("size")
+        print("%-40s %-8s %s" % (result["name"],result["status"],
+                                 "" if size is None else "size %d" % size))
+    if best is not None:
+        print("best: %s %s" % (best["sdd_filename"],best["vtree_filename"]))
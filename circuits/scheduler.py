@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""Schedulers for garbage collection and minimization during compilation.
+
+Every compile_nnf_* function accepts a scheduler.  It calls start(mgr)
+before compiling, step(mgr) after each NNF node is compiled (when all
+live results are referenced), and finish(mgr) at the end.  The decisions
+a scheduler made are returned by metrics().
+
+    Scheduler          never garbage collects or minimizes
+    AutoScheduler      leaves it to SddManager.auto_gc_and_minimize_on
+    AdaptiveScheduler  garbage collects and minimizes, adapting when to
+                       do so to the live/dead counts, and to the time
+                       and benefit of past minimizations
+"""
+
+import time
+
+class Scheduler:
+    """never garbage collects or minimizes"""
+
+    def start(self,mgr):
+        self.start_time = time.time()
+        self.end_time = None
+        self.events = []
+
+    def step(self,mgr):
+        pass
+
+    def finish(self,mgr):
+        self.end_time = time.time()
+
+    def elapsed(self):
+        end_time = time.time() if self.end_time is None else self.end_time
+        return end_time - self.start_time
+
+    def metrics(self):
+        return { "scheduler": type(self).__name__,
+                 "time": self.elapsed(),
+                 "events": list(self.events) }
+
+class AutoScheduler(Scheduler):
+    """garbage collection and minimization are left to the manager's
+    automatic mode (auto_gc_and_minimize_on)"""
+
+    def start(self,mgr):
+        Scheduler.start(self,mgr)
+        mgr.auto_gc_and_minimize_on()
+
+    def finish(self,mgr):
+        mgr.auto_gc_and_minimize_off()
+        Scheduler.finish(self,mgr)
+
+class AdaptiveScheduler(Scheduler):
+    """garbage collects once the dead nodes outnumber both gc_threshold
+    and the live nodes, and minimizes (minimize_limited) once the live
+    nodes reach the minimize limit.
+
+    After each minimization, the limit is set to growth times the live
+    count (and at least minimize_threshold).  The limit grows by another
+    factor of growth if the minimization removed less than min_benefit
+    of the live nodes, and again if minimization has taken more than
+    max_minimize_share of the time so far."""
+
+    def __init__(self,gc_threshold=2**15,minimize_threshold=2**15,
+                 growth=2.0,min_benefit=0.1,max_minimize_share=0.5,
+                 verbose=False):
+        self.gc_threshold = gc_threshold
+        self.minimize_threshold = minimize_threshold
+        self.growth = growth
+        self.min_benefit = min_benefit
+        self.max_minimize_share = max_minimize_share
+        self.verbose = verbose
+
+    def start(self,mgr):
+        Scheduler.start(self,mgr)
+        self.gc_limit = self.gc_threshold
+        self.minimize_limit = self.minimize_threshold
+        self.gc_count,self.gc_time = 0,0.0
+        self.minimize_count,self.minimize_time = 0,0.0
+
+    def step(self,mgr):
+        if mgr.dead_count() >= self.gc_limit:
+            self.garbage_collect(mgr)
+        if mgr.live_count() >= self.minimize_limit:
+            self.minimize(mgr)
+
+    def garbage_collect(self,mgr):
+        if self.verbose: print('+',end='',flush=True)
+        live,dead = mgr.live_count(),mgr.dead_count()
+        start = time.time()
+        mgr.garbage_collect()
+        duration = time.time()-start
+        self.gc_count += 1
+        self.gc_time += duration
+        self.gc_limit = max(self.gc_threshold,mgr.live_count())
+        self.events.append({ "event": "gc", "at": start-self.start_time,
+                             "duration": duration,
+                             "live": live, "dead": dead,
+                             "next_limit": self.gc_limit })
+
+    def minimize(self,mgr):
+        if self.verbose: print('*',end='',flush=True)
+        live,dead = mgr.live_count(),mgr.dead_count()
+        start = time.time()
+        mgr.minimize_limited()
+        duration = time.time()-start
+        after = mgr.live_count()
+        self.minimize_count += 1
+        self.minimize_time += duration
+        benefit = 1.0 - after/live if live else 0.0
+        limit = max(self.minimize_threshold,self.growth*after)
+        if benefit < self.min_benefit:
+            limit *= self.growth
+        if self.minimize_time > self.max_minimize_share*self.elapsed():
+            limit *= self.growth
+        self.minimize_limit = int(limit)
+        self.events.append({ "event": "minimize", "at": start-self.start_time,
+                             "duration": duration,
+                             "live": live, "dead": dead,
+                             "live_after": after, "benefit": benefit,
+                             "next_limit": self.minimize_limit })
+
+    def metrics(self):
+        metrics = Scheduler.metrics(self)
+        metrics.update({ "gc_count": self.gc_count,
+                         "gc_time": self.gc_time,
+                         "gc_limit": self.gc_limit,
+                         "minimize_count": self.minimize_count,
+                         "minimize_time": self.minimize_time,
+                         "minimize_limit": self.minimize_limit })
+        return metrics
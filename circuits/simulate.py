@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""Bit-parallel random simulation.
+
+Each variable is assigned a word: a Python int whose j-th bit is the
+variable's value in the j-th input vector.  A circuit is then simulated
+on all input vectors at once, with AND/OR gates as bitwise operations
+over words.  Words can be arbitrarily wide (e.g., 2**20 bits).
+
+Nnf, CompactNnf, ObddNode and Cnf all support simulate(words,width).
+"""
+
+import random
+
+def popcount(word):
+    return bin(word).count("1")
+
+if hasattr(int,"bit_count"): # python 3.10+
+    popcount = int.bit_count
+
+def random_words(var_count,width,seed=None):
+    """returns a list of var_count+1 random words (index 0 is unused)"""
+    rng = random.Random(seed)
+    return [0] + [ rng.getrandbits(width) for _ in range(var_count) ]
+
+def word_to_inst(words,j):
+    """returns the j-th input vector, as a map: var_index -> {0,1}"""
+    return [0] + [ (word >> j) & 1 for word in words[1:] ]
+
+def check_equivalence(one,two,var_count,total=2**20,width=2**16,seed=None):
+    """compares two circuits by simulation, on total random inputs (in
+    batches of width inputs).  returns None if they agree on all of
+    them, and otherwise an input on which they disagree"""
+    rng = random.Random(seed)
+    for first in range(0,total,width):
+        width = min(width,total-first)
+        words = random_words(var_count,width,seed=rng.getrandbits(64))
+        diff = one.simulate(words,width) ^ two.simulate(words,width)
+        if diff:
+            j = (diff & -diff).bit_length()-1 # lowest differing input
+            return word_to_inst(words,j)
+    return None
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+"""Telemetry for compiling NNF circuits into SDDs.
+
+Every compile_nnf_* function accepts a Telemetry, which records, as a
+stream of dicts (records), the following events:
+
+    start     strategy, number of NNF nodes and variables
+    node      one per compiled NNF node: its id, type, number of
+              children, depth (longest path from the root), the time to
+              compile it (excluding its children), the size of its SDD,
+              the number, largest and total size of the intermediate
+              SDDs of combining its children (see COMBINE_POLICIES in
+              circuits.compiler), and the live/dead counts of the
+              manager afterwards
+    gc        garbage collections and minimizations decided by the
+    minimize  scheduler (see circuits.scheduler)
+    depth     one per depth, for compile_nnf_recursive_by_depth
+    finish    total time, final SDD size, and live/dead counts
+
+Records are passed to each of the telemetry's sinks (MemorySink,
+JsonLinesSink, CsvSink), and summarized (see Summary) into the top-k
+most expensive nodes and depths.
+
+    >>> telemetry = Telemetry(JsonLinesSink("compile.jsonl"))
+    >>> alpha = compile_nnf_manual(nnf,mgr,telemetry=telemetry)
+    >>> print(telemetry.summary())
+
+Without a telemetry, a compiler uses NULL_TELEMETRY, whose methods do
+nothing.  SDD sizes and live/dead counts cost a traversal per node, and
+can be turned off with Telemetry(sizes=False,counts=False).
+"""
+
+import csv
+import json
+import time
+import heapq
+from collections import defaultdict
+
+from .circuits import Literal, AndGate, OrGate
+
+def node_type(node):
+    if isinstance(node,Literal): return "literal"
+    if isinstance(node,AndGate): return "and"
+    if isinstance(node,OrGate): return "or"
+    return type(node).__name__
+
+def node_depths(nnf):
+    """returns a dict mapping each node of nnf to the length of the
+    longest path to it from the root"""
+    nodes = nnf.nodes()
+    depths = { node: 0 for node in nodes }
+    for node in reversed(nodes):
+        if isinstance(node,Literal): continue
+        depth = depths[node] + 1
+        for child in node.children:
+            if depths[child] < depth: depths[child] = depth
+    return depths
+
+############################################################
+# sinks
+############################################################
+
+class MemorySink:
+    """keeps records in the list self.records"""
+
+    def __init__(self):
+        self.records = []
+
+    def write(self,record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+class JsonLinesSink:
+    """writes records to filename, one JSON object per line"""
+
+    def __init__(self,filename):
+        self.filename = filename
+        self.f = None
+
+    def write(self,record):
+        if self.f is None: self.f = open(self.filename,'w')
+        self.f.write(json.dumps(record) + "\n")
+
+    def close(self):
+        if self.f is not None: self.f.close()
+        self.f = None
+
+class CsvSink:
+    """writes records to filename as CSV, with one column per field
+    (other fields are dropped, and missing fields are left empty)"""
+
+    FIELDS = ["event","position","node","type","children","depth",
+              "time","size","intermediates","max_intermediate",
+              "total_intermediate","live","dead","duration","nodes"]
+
+    def __init__(self,filename,fields=None):
+        self.filename = filename
+        self.fields = CsvSink.FIELDS if fields is None else fields
+        self.f = None
+
+    def write(self,record):
+        if self.f is None:
+            self.f = open(self.filename,'w',newline='')
+            self.writer = csv.DictWriter(self.f,self.fields,
+                                         extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow(record)
+
+    def close(self):
+        if self.f is not None: self.f.close()
+        self.f = None
+
+class ProgressSink:
+    """prints compilation progress (used by the compilers when verbose)"""
+
+    def write(self,record):
+        event = record["event"]
+        if event == "start":
+            self.node_count = record["nodes"]
+            print("count %d:\n" % self.node_count)
+        elif event == "node":
+            count,node_count = record["position"],self.node_count
+            if (count >= .999*node_count) or \
+               (count >=  .99*node_count and count % 50 == 0)  or \
+               (count >=   .9*node_count and count % 500 == 0) or \
+                count % 5000 == 0:
+                print(" %d" % count,flush=True)
+        elif event == "depth":
+            print("depth: %d (%d nodes)" % (record["depth"],record["nodes"]))
+            if record.get("live") is not None:
+                print("live count:", record["live"])
+                print("dead count:", record["dead"])
+
+    def close(self):
+        pass
+
+############################################################
+# summary
+############################################################
+
+class Summary:
+    """the top-k nodes by compile time and by SDD size, the top-k depths
+    by total compile time, and counts of gc/minimize events"""
+
+    def __init__(self,k=10):
+        self.k = k
+        self.slowest = [] # heaps of (key,position,record)
+        self.largest = []
+        self.depths = defaultdict(lambda: { "nodes": 0, "time": 0.0,
+                                            "max_size": 0 })
+        self.events = defaultdict(lambda: { "count": 0, "duration": 0.0 })
+        self.node_count = 0
+        self.node_time = 0.0
+        self.total_time = None
+        self.intermediate_total = 0
+        self.intermediate_max = 0
+
+    def _push(self,heap,key,record):
+        item = (key,self.node_count,record)
+        if len(heap) < self.k:
+            heapq.heappush(heap,item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap,item)
+
+    def add(self,record):
+        event = record["event"]
+        if event == "node":
+            self.node_count += 1
+            self.node_time += record["time"]
+            self._push(self.slowest,record["time"],record)
+            size = record.get("size")
+            if size is not None: self._push(self.largest,size,record)
+            depth = self.depths[record.get("depth")]
+            depth["nodes"] += 1
+            depth["time"] += record["time"]
+            if size is not None and size > depth["max_size"]:
+                depth["max_size"] = size
+            self.intermediate_total += record.get("total_intermediate",0)
+            self.intermediate_max = max(self.intermediate_max,
+                                        record.get("max_intermediate",0))
+        elif event in ("gc","minimize"):
+            self.events[event]["count"] += 1
+            self.events[event]["duration"] += record["duration"]
+        elif event == "finish":
+            self.total_time = record["time"]
+
+    def result(self):
+        top = lambda heap: [ record for _,_,record in sorted(heap,reverse=True) ]
+        depths = sorted(self.depths.items(),key=lambda item: -item[1]["time"])
+        depths = [ dict(depth=depth,**stats) for depth,stats in depths ]
+        return { "node_count": self.node_count,
+                 "node_time": self.node_time,
+                 "total_time": self.total_time,
+                 "intermediate_total": self.intermediate_total,
+                 "intermediate_max": self.intermediate_max,
+                 "events": { event: dict(stats) for event,stats
+                             in self.events.items() },
+                 "slowest": top(self.slowest),
+                 "largest": top(self.largest),
+                 "depths": depths[:self.k] }
+
+    def __str__(self):
+        result = self.result()
+        lines = [ "%d nodes compiled in %.3fs" % \
+                  (result["node_count"],result["node_time"]) ]
+        if result["total_time"] is not None:
+            lines.append("total time %.3fs" % result["total_time"])
+        if result["intermediate_total"]:
+            lines.append("intermediate sdds: total size %d, largest %d" % \
+                         (result["intermediate_total"],
+                          result["intermediate_max"]))
+        for event,stats in sorted(result["events"].items()):
+            lines.append("%s: %d in %.3fs" % \
+                         (event,stats["count"],stats["duration"]))
+        node_line = "  node %(node)d (%(type)s, %(children)s children," \
+                    " depth %(depth)s): %(time).4fs size %(size)s"
+        lines.append("slowest nodes:")
+        lines.extend( node_line % r for r in result["slowest"] )
+        lines.append("largest nodes:")
+        lines.extend( node_line % r for r in result["largest"] )
+        lines.append("slowest depths:")
+        lines.extend( "  depth %(depth)s: %(nodes)d nodes %(time).4fs"
+                      " max size %(max_size)d" % d for d in result["depths"] )
+        return "\n".join(lines)
+
+def read_records(filename):
+    """reads the records of a JsonLinesSink"""
+    with open(filename,'r') as f:
+        return [ json.loads(line) for line in f if line.strip() ]
+
+def summarize(records,k=10):
+    """summarizes records (a list of records, or a JsonLinesSink
+    filename)"""
+    if isinstance(records,str): records = read_records(records)
+    summary = Summary(k)
+    for record in records: summary.add(record)
+    return summary
+
+############################################################
+# telemetry
+############################################################
+
+class Telemetry:
+    """records the compilation of an NNF to its sinks (a sink or a list
+    of sinks), keeping a Summary of the top k nodes and depths.  sizes
+    and counts enable the SDD size and live/dead counts of node records"""
+
+    enabled = True
+
+    def __init__(self,sinks=None,k=10,sizes=True,counts=True):
+        if sinks is None: sinks = []
+        if not isinstance(sinks,(list,tuple)): sinks = [sinks]
+        self.sinks = list(sinks)
+        self.k = k
+        self.sizes = sizes
+        self.counts = counts
+        self._summary = Summary(k)
+
+    def start(self,nnf,mgr,strategy,scheduler=None,verbose=False):
+        self.run_sinks = self.sinks + [ProgressSink()] if verbose \
+                         else self.sinks
+        self.scheduler = scheduler
+        self.event_count = 0 if scheduler is None else len(scheduler.events)
+        self.depths = node_depths(nnf)
+        self.position = 0
+        self.stack = [] # (start time, time spent in children,
+                        #  intermediates, their max and total size)
+        self.start_time = time.perf_counter()
+        self._summary = Summary(self.k)
+        self.write({ "event": "start", "strategy": strategy,
+                     "nodes": len(self.depths),
+                     "vars": nnf.var_count })
+
+    def write(self,record):
+        self._summary.add(record)
+        for sink in self.run_sinks: sink.write(record)
+
+    def _flush_events(self):
+        """writes the scheduler events since the last node"""
+        if self.scheduler is None: return
+        events = self.scheduler.events
+        while self.event_count < len(events):
+            self.write(dict(events[self.event_count]))
+            self.event_count += 1
+
+    def _counts(self,mgr,record,force=False):
+        if not (self.counts or force): return record
+        if not hasattr(mgr,"live_count"): return record
+        record["live"] = mgr.live_count()
+        record["dead"] = mgr.dead_count()
+        return record
+
+    def begin(self):
+        """called before compiling a node"""
+        self.stack.append([time.perf_counter(),0.0,0,0,0])
+
+    def intermediate(self,alpha,size=None):
+        """called for each intermediate result alpha of combining the
+        children of the node being compiled (size, if known)"""
+        if not self.sizes: return
+        if size is None:
+            if not hasattr(alpha,"size"): return
+            size = alpha.size()
+        frame = self.stack[-1]
+        frame[2] += 1
+        if size > frame[3]: frame[3] = size
+        frame[4] += size
+
+    def node(self,node,alpha,mgr):
+        """called after compiling node into alpha"""
+        start,child_time,count,max_size,total_size = self.stack.pop()
+        duration = time.perf_counter()-start
+        if self.stack: self.stack[-1][1] += duration
+        self._flush_events()
+        self.position += 1
+        children = 0 if isinstance(node,Literal) else len(node.children)
+        size = alpha.size() if self.sizes and hasattr(alpha,"size") else None
+        record = { "event": "node", "position": self.position,
+                   "node": node.node_id, "type": node_type(node),
+                   "children": children, "depth": self.depths.get(node),
+                   "time": duration-child_time, "size": size,
+                   "intermediates": count, "max_intermediate": max_size,
+                   "total_intermediate": total_size }
+        self.write(self._counts(mgr,record))
+
+    def depth(self,depth,count,mgr):
+        """called after compiling the count nodes at depth"""
+        self._flush_events()
+        record = { "event": "depth", "depth": depth, "nodes": count }
+        self.write(self._counts(mgr,record,force=True))
+
+    def finish(self,mgr,alpha):
+        self._flush_events()
+        size = alpha.size() if self.sizes and hasattr(alpha,"size") else None
+        record = { "event": "finish",
+                   "time": time.perf_counter()-self.start_time,
+                   "size": size }
+        self.write(self._counts(mgr,record,force=True))
+        for sink in self.run_sinks: sink.close()
+        self.depths = None
+
+    def summary(self):
+        """the Summary of the last compilation"""
+        return self._summary
+
+class NullTelemetry(Telemetry):
+    """records nothing"""
+
+    enabled = False
+
+    def __init__(self):
+        Telemetry.__init__(self)
+
+    def start(self,nnf,mgr,strategy,scheduler=None,verbose=False): pass
+    def begin(self): pass
+    def intermediate(self,alpha,size=None): pass
+    def node(self,node,alpha,mgr): pass
+    def depth(self,depth,count,mgr): pass
+    def finish(self,mgr,alpha): pass
+
+NULL_TELEMETRY = NullTelemetry()
+
+def get_telemetry(telemetry,verbose):
+    """the telemetry a compiler uses: telemetry if given, a telemetry
+    printing progress if verbose, and NULL_TELEMETRY otherwise"""
+    if telemetry is not None: return telemetry
+    if verbose: return Telemetry(sizes=False,counts=False)
+    return NULL_TELEMETRY
@@ -1,9 +1,257 @@
 import sys
+import json
 import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+def _peak_rss():
+    """peak resident set size of the process, in bytes (or None)"""
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss*1024
+
+class Stage:
+    """the statistics of a stage of a Profiler, aggregated over all the
+    times it was entered (with the same parent stages)"""
+
+    def __init__(self,name):
+        self.name = name
+        self.children = {}
+        self.count = 0
+        self.wall = 0.0
+        self.wall_min = None
+        self.wall_max = None
+        self.cpu = 0.0
+        self.rss_peak = None    # peak RSS at the end of the stage
+        self.rss_growth = 0     # growth of the peak RSS during the stage
+        self.mem_delta = 0      # tracemalloc: memory allocated, net
+        self.mem_peak = None    # tracemalloc: peak, above the start
+
+    def child(self,name):
+        if name not in self.children: self.children[name] = Stage(name)
+        return self.children[name]
+
+    def add(self,wall,cpu,rss_peak,rss_growth,mem_delta,mem_peak):
+        self.count += 1
+        self.wall += wall
+        self.cpu += cpu
+        if self.wall_min is None or wall < self.wall_min: self.wall_min = wall
+        if self.wall_max is None or wall > self.wall_max: self.wall_max = wall
+        if rss_peak is not None:
+            self.rss_peak = max(self.rss_peak or 0,rss_peak)
+            self.rss_growth = max(self.rss_growth,rss_growth)
+        if mem_peak is not None:
+            self.mem_delta += mem_delta
+            self.mem_peak = max(self.mem_peak or 0,mem_peak)
+
+    def merge(self,other):
+        """adds the statistics of other (a Stage of the same name)"""
+        self.count += other.count
+        self.wall += other.wall
+        self.cpu += other.cpu
+        for attr,pick in (("wall_min",min),("wall_max",max),
+                          ("rss_peak",max),("mem_peak",max)):
+            mine,theirs = getattr(self,attr),getattr(other,attr)
+            if theirs is not None:
+                setattr(self,attr,theirs if mine is None else pick(mine,theirs))
+        self.rss_growth = max(self.rss_growth,other.rss_growth)
+        self.mem_delta += other.mem_delta
+        for name,child in other.children.items():
+            self.child(name).merge(child)
+
+    def self_wall(self):
+        """wall-clock time not spent in child stages"""
+        return max(0.0,self.wall - sum(c.wall for c in self.children.values()))
+
+    def to_dict(self):
+        return { "name": self.name, "count": self.count,
+                 "wall": self.wall, "wall_min": self.wall_min,
+                 "wall_max": self.wall_max,
+                 "wall_mean": self.wall/self.count if self.count else None,
+                 "cpu": self.cpu,
+                 "rss_peak": self.rss_peak, "rss_growth": self.rss_growth,
+                 "mem_delta": self.mem_delta, "mem_peak": self.mem_peak,
+                 "children": [ c.to_dict() for c in self.children.values() ] }
+
+    @staticmethod
+    def from_dict(d):
+        stage = Stage(d["name"])
+        for key in ("count","wall","wall_min","wall_max","cpu","rss_peak",
+                    "rss_growth","mem_delta","mem_peak"):
+            setattr(stage,key,d[key])
+        for child in d["children"]:
+            stage.children[child["name"]] = Stage.from_dict(child)
+        return stage
+
+class _Scope:
+    """an entered stage of a profiler"""
+
+    def __init__(self,profiler,name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self,type,value,traceback):
+        self.profiler._exit()
+
+class Profiler:
+    """a hierarchical profiler of nested stages.  Each stage records its
+    number of calls, wall-clock and CPU time, and the peak RSS of the
+    process.  With trace_memory, each stage also records (using
+    tracemalloc) its net allocations and its peak allocation.
+
+    Stages are entered with "with profiler.stage(name)", or with
+    "with Timer(name)" while the profiler is active ("with profiler").
+    Entering a stage again under the same parents aggregates its
+    statistics, as does merging the profiler of another run.
+
+    >>> profiler = Profiler()
+    >>> with profiler:
+    ...   with Timer("reading"):
+    ...     ...
+    ...   with profiler.stage("compiling"):
+    ...     with profiler.stage("minimizing"):
+    ...       ...
+    >>> print(profiler.report())
+    >>> profiler.save_folded("profile.folded") # for flamegraph.pl
+    """
+
+    def __init__(self,name="total",trace_memory=False):
+        self.root = Stage(name)
+        self.trace_memory = trace_memory
+        self.stack = []  # (stage,wall,cpu,rss,mem,peak seen)
+        self.started_tracing = False
+
+    def stage(self,name):
+        return _Scope(self,name)
+
+    def __enter__(self):
+        _active.append(self)
+        self._enter(None)
+        return self
+
+    def __exit__(self,type,value,traceback):
+        self._exit()
+        _active.pop()
+
+    def _enter(self,name):
+        if name is None: # the root
+            stage = self.root
+        elif self.stack:
+            stage = self.stack[-1][0].child(name)
+        else:
+            stage = self.root.child(name)
+        mem = None
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            mem,peak = tracemalloc.get_traced_memory()
+            if self.stack: # the parent's peak, before resetting it
+                frame = self.stack[-1]
+                frame[5] = max(frame[5],peak)
+            tracemalloc.reset_peak()
+        self.stack.append([stage,time.perf_counter(),time.process_time(),
+                           _peak_rss(),mem,mem])
+
+    def _exit(self):
+        stage,wall,cpu,rss,mem,peak = self.stack.pop()
+        wall = time.perf_counter()-wall
+        cpu = time.process_time()-cpu
+        rss_peak = _peak_rss()
+        rss_growth = None if rss is None else rss_peak-rss
+        mem_delta = mem_peak = None
+        if mem is not None:
+            current,traced_peak = tracemalloc.get_traced_memory()
+            peak = max(peak,traced_peak)
+            mem_delta,mem_peak = current-mem,peak-mem
+            if self.stack:
+                frame = self.stack[-1]
+                frame[5] = max(frame[5],peak)
+            elif self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+        stage.add(wall,cpu,rss_peak,rss_growth,mem_delta,mem_peak)
+
+    def merge(self,other):
+        """adds the stages of other (e.g., a repeated run)"""
+        self.root.merge(other.root)
+
+    def stages(self):
+        """yields (path,stage) for each stage, parents first, where path
+        is a tuple of stage names from the root"""
+        frontier = [ ((self.root.name,),self.root) ]
+        while frontier:
+            path,stage = frontier.pop()
+            yield path,stage
+            for child in reversed(list(stage.children.values())):
+                frontier.append((path + (child.name,),child))
+
+    def to_dict(self):
+        return self.root.to_dict()
+
+    def save_json(self,filename):
+        with open(filename,'w') as f:
+            json.dump(self.to_dict(),f,indent=2)
+
+    @staticmethod
+    def read_json(filename):
+        profiler = Profiler()
+        with open(filename,'r') as f:
+            profiler.root = Stage.from_dict(json.load(f))
+        return profiler
+
+    def folded(self):
+        """the stages as folded stacks ("a;b;c microseconds", one line per
+        stage, with the wall-clock time not spent in child stages), as
+        read by flamegraph.pl and speedscope"""
+        lines = []
+        for path,stage in self.stages():
+            micros = int(round(stage.self_wall()*1e6))
+            if micros > 0:
+                names = ( name.replace(";",",").replace(" ","_")
+                          for name in path )
+                lines.append("%s %d" % (";".join(names),micros))
+        return "\n".join(lines) + "\n"
+
+    def save_folded(self,filename):
+        with open(filename,'w') as f:
+            f.write(self.folded())
+
+    def report(self):
+        """the stages as an indented table"""
+        lines = [ "%-40s %6s %10s %10s %10s %10s" % \
+                  ("stage","count","wall","cpu","rss peak","mem peak") ]
+        mb = lambda b: "" if b is None else "%.1fM" % (b/2**20)
+        for path,stage in self.stages():
+            if stage.count == 0 and len(path) == 1: continue
+            name = "  "*(len(path)-1) + stage.name
+            lines.append("%-40s %6d %9.3fs %9.3fs %10s %10s" % \
+                         (name,stage.count,stage.wall,stage.cpu,
+                          mb(stage.rss_peak),mb(stage.mem_peak)))
+        return "\n".join(lines)
+
+# the stack of active profilers, innermost last.  the default profiler
+# is always active, so every Timer is recorded somewhere
+default_profiler = Profiler()
+_active = [default_profiler]
+
+def active_profiler():
+    return _active[-1]
 
 class Timer:
     """Utility for timing code via Python's "with" statement.
 
+    The time is also recorded as a stage of the active Profiler (or of
+    profiler, if given); see Profiler.
+
     Examples
     --------
 
@@ -18,16 +266,21 @@ class Timer:
     # timing ... 2.002s
     """
 
-    def __init__(self,msg,prefix="= "):
+    def __init__(self,msg,prefix="= ",profiler=None):
         self.msg = msg
         self.prefix = prefix
+        self.profiler = profiler
 
     def __enter__(self):
         print( self.prefix + self.msg + " ... ", end='' )
         sys.stdout.flush()
+        self.scope = (self.profiler or active_profiler()).stage(self.msg)
+        self.scope.__enter__()
         self.start = time.time()
         return self
 
     def __exit__(self,type,value,traceback):
-        print( "%.3fs" % (time.time()-self.start) )
+        elapsed = time.time()-self.start
+        self.scope.__exit__(type,value,traceback)
+        print( "%.3fs" % elapsed )
         sys.stdout.flush()
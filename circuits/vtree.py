@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+"""Vtrees derived from the structure of an NNF circuit.
+
+The built-in vtrees of PySDD (right, balanced, ...) ignore the circuit
+being compiled.  Here, a vtree is instead derived from the incidence
+graph of the circuit, which has a vertex per variable and per gate, and
+an edge between each gate and each of its children (a literal's edge
+goes to its variable).  Variables that meet in a few gates are kept
+close in the vtree, which keeps the intermediate SDDs of a compilation
+small.  There are two strategies:
+
+    minfill    eliminates the vertices of the graph in min-fill order;
+               each variable is placed above the (balanced) vtrees of
+               the vertices eliminated before it, in the elimination
+               tree.  this is the dtree of the elimination order, where
+               each variable is placed where it is eliminated
+    bisection  recursively splits the graph into two parts with equal
+               numbers of variables and few edges between them (a
+               breadth-first split, refined by Fiduccia-Mattheyses
+               style moves); each split is a vtree node
+
+Min-fill suits sparse circuits (e.g., of CNFs).  In a flattened
+network, each neuron connects all of its inputs, so the fill (and the
+time to find the order) grows quickly, and bisection is usually both
+faster and better.
+
+A vtree is first built as nested pairs, with a variable at each leaf,
+and then turned into a PySDD Vtree by make_vtree.
+
+    >>> vtree = structure_vtree(flat,"minfill")
+    >>> mgr = SddManager.from_vtree(vtree)
+"""
+
+import heapq
+from collections import deque
+
+from .circuits import Literal
+from .obdd import read_text
+
+# the vtree types built into PySDD
+VTREE_TYPES = ("right","left","vertical","balanced","random")
+
+def incidence_graph(nnf):
+    """returns the incidence graph of nnf, as a list of sets of
+    neighbors, where vertices 1..var_count are variables and the
+    remaining vertices are gates (vertex 0 is unused)"""
+    var_count = nnf.var_count
+    nodes = nnf.nodes()
+    vertex = {}
+    for node in nodes:
+        if isinstance(node,Literal):
+            vertex[node] = node.var
+        else:
+            vertex[node] = var_count + 1 + len(vertex)
+    graph = [ set() for _ in range(var_count + 1 + len(vertex)) ]
+    for node in nodes:
+        if isinstance(node,Literal): continue
+        u = vertex[node]
+        for child in node.children:
+            v = vertex[child]
+            graph[u].add(v)
+            graph[v].add(u)
+    # drop the unused vertices of literals
+    used = set(vertex.values())
+    for v in range(var_count+1,len(graph)):
+        if v not in used: graph[v] = None
+    return graph
+
+def balanced(trees):
+    """combines the vtrees trees (None for empty) into one, by pairing
+    the two with the fewest leaves until one is left (None if none)"""
+    heap = [ (_leaf_count(tree),i,tree) for i,tree in enumerate(trees)
+             if tree is not None ]
+    if not heap: return None
+    heapq.heapify(heap)
+    index = len(trees)
+    while len(heap) > 1:
+        size1,_,tree1 = heapq.heappop(heap)
+        size2,_,tree2 = heapq.heappop(heap)
+        heapq.heappush(heap,(size1+size2,index,(tree1,tree2)))
+        index += 1
+    return heap[0][2]
+
+def _leaf_count(tree):
+    count,stack = 0,[tree]
+    while stack:
+        tree = stack.pop()
+        if isinstance(tree,tuple):
+            stack.extend(tree)
+        else:
+            count += 1
+    return count
+
+############################################################
+# min-fill
+############################################################
+
+def _fill(graph,v,max_degree):
+    """the number of edges that eliminating v would add.  above
+    max_degree, the (cheaper) upper bound d(d-1)/2 is used"""
+    neighbors = graph[v]
+    d = len(neighbors)
+    if d > max_degree: return d*(d-1)//2
+    missing = 0
+    for u in neighbors:
+        missing += d - 1 - len(graph[u] & neighbors)
+    return missing//2
+
+def minfill_order(graph,max_degree=16):
+    """returns an elimination order of the vertices of graph (a list of
+    sets, where None marks an unused vertex), greedily eliminating a
+    vertex adding the fewest edges (ties to the lowest degree).  also
+    returns, for each vertex, its neighbors when it was eliminated.
+    graph is consumed.
+
+    After an elimination, only the fill of the neighbors is updated.
+    The fill of their own neighbors can only drop, and is updated when
+    they reach the top of the queue, so the order is approximately
+    min-fill (as in most implementations)"""
+    heap = []
+    for v,neighbors in enumerate(graph):
+        if v == 0 or neighbors is None: continue
+        heap.append((_fill(graph,v,max_degree),len(neighbors),v))
+    heapq.heapify(heap)
+    eliminated = [False]*len(graph)
+    order,separators = [],{}
+    while heap:
+        fill,degree,v = heapq.heappop(heap)
+        if eliminated[v]: continue
+        neighbors = graph[v]
+        current = (_fill(graph,v,max_degree),len(neighbors))
+        if (fill,degree) != current: # stale
+            heapq.heappush(heap,current + (v,))
+            continue
+        eliminated[v] = True
+        order.append(v)
+        separators[v] = neighbors
+        for u in neighbors:
+            graph[u].discard(v)
+            graph[u] |= neighbors
+            graph[u].discard(u)
+        for u in neighbors:
+            heapq.heappush(heap,(_fill(graph,u,max_degree),len(graph[u]),u))
+        graph[v] = None
+    return order,separators
+
+def minfill_vtree(nnf,max_degree=16):
+    """a vtree from the elimination tree of a min-fill order of the
+    incidence graph of nnf"""
+    var_count = nnf.var_count
+    graph = incidence_graph(nnf)
+    order,separators = minfill_order(graph,max_degree)
+    position = { v: i for i,v in enumerate(order) }
+    children = {}
+    roots = []
+    trees = {}
+    for v in order:
+        # children precede their parent in the order
+        subtrees = [ trees.pop(c) for c in children.get(v,[]) ]
+        if v <= var_count: subtrees.append(v)
+        trees[v] = balanced(subtrees)
+        separator = separators[v]
+        if separator:
+            parent = min(separator,key=position.__getitem__)
+            children.setdefault(parent,[]).append(v)
+        else:
+            roots.append(v)
+    return balanced([ trees[v] for v in roots ])
+
+############################################################
+# recursive bisection
+############################################################
+
+def _bfs_order(graph,vertices):
+    """the vertices (a set), in breadth-first order from a
+    pseudo-peripheral vertex, component by component"""
+    order,seen = [],set()
+    for start in sorted(vertices):
+        if start in seen: continue
+        for _ in range(2): # find a far vertex, then search from it
+            component = _bfs(graph,vertices,start)
+            start = component[-1]
+        seen.update(component)
+        order.extend(component)
+    return order
+
+def _bfs(graph,vertices,start):
+    order,seen = [start],{start}
+    queue = deque([start])
+    while queue:
+        v = queue.popleft()
+        for u in graph[v]:
+            if u in vertices and u not in seen:
+                seen.add(u)
+                order.append(u)
+                queue.append(u)
+    return order
+
+def _refine(graph,var_count,side,low,high,passes):
+    """moves vertices between sides 0 and 1 (side maps vertex to side)
+    while this cuts fewer edges, keeping the number of variables on
+    side 0 within [low,high]"""
+    left = sum( 1 for v,s in side.items() if s == 0 and v <= var_count )
+    for _ in range(passes):
+        moved = False
+        gains = []
+        for v,s in side.items():
+            gain = 0
+            for u in graph[v]:
+                if u in side: gain += 1 if side[u] != s else -1
+            if gain > 0: gains.append((-gain,v))
+        gains.sort()
+        for _,v in gains:
+            s = side[v]
+            gain = 0
+            for u in graph[v]:
+                if u in side: gain += 1 if side[u] != s else -1
+            if gain <= 0: continue
+            if v <= var_count:
+                new_left = left - 1 if s == 0 else left + 1
+                if not low <= new_left <= high: continue
+                left = new_left
+            side[v] = 1-s
+            moved = True
+        if not moved: break
+
+def bisection_vtree(nnf,imbalance=0.1,passes=4):
+    """a vtree from a recursive bisection of the incidence graph of nnf,
+    where each part has between 1/2-imbalance and 1/2+imbalance of the
+    variables being split"""
+    var_count = nnf.var_count
+    graph = incidence_graph(nnf)
+    vertices = set( v for v in range(1,len(graph)) if graph[v] is not None )
+    # splits are done with an explicit stack: (vertices,parent,slot)
+    root = [None]
+    stack = [(vertices,root,0)]
+    while stack:
+        vertices,parent,slot = stack.pop()
+        variables = [ v for v in vertices if v <= var_count ]
+        if len(variables) <= 1:
+            parent[slot] = variables[0] if variables else None
+            continue
+        n = len(variables)
+        half = n//2
+        side,count = {},0
+        for v in _bfs_order(graph,vertices):
+            side[v] = 0 if count < half else 1
+            if v <= var_count: count += 1
+        low = max(1,int((0.5-imbalance)*n))
+        high = min(n-1,max(low,int(round((0.5+imbalance)*n))))
+        _refine(graph,var_count,side,low,high,passes)
+        node = [None,None]
+        parent[slot] = node
+        left = set( v for v,s in side.items() if s == 0 )
+        stack.append((left,node,0))
+        stack.append((vertices-left,node,1))
+    return _to_tuples(root[0])
+
+def _to_tuples(tree):
+    """converts the nested lists of bisection_vtree to nested pairs,
+    dropping empty subtrees"""
+    if not isinstance(tree,list): return tree
+    # an explicit post-order, as the tree may be deep
+    result = {}
+    stack = [(tree,False)]
+    while stack:
+        node,expanded = stack.pop()
+        if not isinstance(node,list):
+            result[id(node)] = node
+            continue
+        if not expanded:
+            stack.append((node,True))
+            stack.extend( (child,False) for child in node )
+            continue
+        left,right = ( result[id(child)] for child in node )
+        if left is None: result[id(node)] = right
+        elif right is None: result[id(node)] = left
+        else: result[id(node)] = (left,right)
+    return result[id(tree)]
+
+############################################################
+# vtrees
+############################################################
+
+STRATEGIES = {
+    "minfill": minfill_vtree,
+    "bisection": bisection_vtree,
+}
+
+def vtree_text(tree,var_count):
+    """the text of the .vtree file of tree (nested pairs of variables).
+    variables 1..var_count missing from tree are added, balanced, to
+    its right"""
+    present = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node,tuple): stack.extend(node)
+        elif node is not None: present.add(node)
+    missing = [ var for var in range(1,var_count+1) if var not in present ]
+    if missing: tree = balanced([tree,balanced(missing)])
+
+    # an explicit post-order (children before parents), as the tree may
+    # be deep.  numbers holds the ids of the subtrees done so far
+    lines,numbers = [],[]
+    stack = [(tree,False)]
+    while stack:
+        node,expanded = stack.pop()
+        i = len(lines)
+        if not isinstance(node,tuple):
+            lines.append("L %d %d" % (i,node))
+        elif not expanded:
+            stack.append((node,True))
+            stack.append((node[1],False))
+            stack.append((node[0],False))
+            continue
+        else:
+            right,left = numbers.pop(),numbers.pop()
+            lines.append("I %d %d %d" % (i,left,right))
+        numbers.append(i)
+    return "vtree %d\n%s\n" % (len(lines),"\n".join(lines))
+
+def make_vtree(tree,var_count):
+    """the PySDD Vtree of tree (nested pairs of variables)"""
+    from pysdd.sdd import Vtree
+    return read_text(vtree_text(tree,var_count),Vtree.from_file,
+                     suffix=".vtree")
+
+def structure_vtree(nnf,strategy="minfill"):
+    """the PySDD Vtree of nnf given by the named strategy (see
+    STRATEGIES)"""
+    if strategy not in STRATEGIES:
+        msg = "unknown strategy %s" % strategy
+        raise Exception("structure_vtree: %s" % msg)
+    return make_vtree(STRATEGIES[strategy](nnf),nnf.var_count)
+
+def get_vtree(nnf,vtree_type="right",var_order=None):
+    """the PySDD Vtree of nnf: a structure-derived vtree if vtree_type is
+    a key of STRATEGIES, and otherwise, a PySDD vtree of that type (see
+    VTREE_TYPES), over var_order if given"""
+    from pysdd.sdd import Vtree
+    if vtree_type in STRATEGIES:
+        return structure_vtree(nnf,vtree_type)
+    if vtree_type not in VTREE_TYPES:
+        msg = "unknown vtree type %s" % vtree_type
+        raise Exception("get_vtree: %s" % msg)
+    if var_order is None:
+        return Vtree(var_count=nnf.var_count,vtree_type=vtree_type)
+    return Vtree.new_with_var_order(nnf.var_count,var_order,vtree_type)